@@ -27,14 +27,8 @@ bl_info = {
 	"category": "Object"
 }
 
-import bpy, importlib
+import bpy, os, sys, importlib
 from bpy.props import StringProperty
-from . import import_umodel_material
-from . import props_txt_to_json
-from . import utils
-from . import batch_import_psk
-from . import cleanup_mesh
-from . import kena_generate_catalogs
 
 class uModelIOAddonPrefs(bpy.types.AddonPreferences):
 	# this must match the addon name, use '__package__'
@@ -44,7 +38,7 @@ class uModelIOAddonPrefs(bpy.types.AddonPreferences):
 	extract_path: StringProperty(
 		name="Extract Path",
 		subtype='DIR_PATH',
-		default='D:\\Path_to_your_extract_folder\\',
+		default='',
 		description="Path to where you extracted the game files using umodel.exe. Will be searching for .tga textures here"
 	)
 
@@ -53,19 +47,40 @@ class uModelIOAddonPrefs(bpy.types.AddonPreferences):
 		layout.label(text="uModel Importer settings:")
 		layout.prop(self, "extract_path")
 
-modules = [
-	import_umodel_material
-    ,props_txt_to_json
-    ,utils
-    ,cleanup_mesh
-    ,batch_import_psk
-	,kena_generate_catalogs
+# Submodules with classes or handlers to register. They are only imported when the addon is registered,
+# so background workers that import a single submodule don't pay for the rest.
+module_names = [
+	'import_umodel_material'
+	,'props_txt_to_json'
+	,'utils'
+	,'cleanup_mesh'
+	,'batch_import_psk'
+	,'kena_generate_catalogs'
+	,'thumbnail_farm'
+	,'asset_sync'
+	,'dependency_index'
+	,'texture_proxies'
 ]
+modules = []
+
+# Set this environment variable while working on the addon, to pick up code changes when it is enabled again.
+DEV_RELOAD = bool(os.environ.get("KENA_DEV_RELOAD"))
+
+def import_modules() -> list:
+	imported = []
+	for name in module_names:
+		full_name = __package__ + "." + name
+		already_imported = full_name in sys.modules
+		m = importlib.import_module(full_name)
+		if DEV_RELOAD and already_imported:
+			m = importlib.reload(m)
+		imported.append(m)
+	return imported
 
 from bpy.utils import register_class, unregister_class
 def register():
+	modules[:] = import_modules()
 	for m in modules:
-		importlib.reload(m)
 		if hasattr(m, 'registry'):
 			for c in m.registry:
 				register_class(c)
@@ -81,5 +96,6 @@ def unregister():
 		if hasattr(m, 'registry'):
 			for c in m.registry:
 				unregister_class(c)
+	modules.clear()
 
-	bpy.utils.unregister_class(uModelIOAddonPrefs)
\ No newline at end of file
+	bpy.utils.unregister_class(uModelIOAddonPrefs)
@@ -0,0 +1,141 @@
+# Reading, indexing and writing Blender's asset catalog definition file.
+# Nothing in here may import bpy.
+
+from typing import List, Dict, Optional, NamedTuple, Iterator
+from uuid import uuid5, NAMESPACE_URL
+
+ASSET_HEADER = """
+# This is an Asset Catalog Definition file for Blender.
+#
+# Empty lines and lines starting with `#` will be ignored.
+# The first non-ignored line should be the version indicator.
+# Other lines are of the format "UUID:catalog/path/for/assets:simple catalog name"
+
+VERSION 1
+
+"""
+ASSET_FILENAME = "blender_assets.cats.txt"
+
+# Catalog UUIDs are derived from the catalog path with this namespace,
+# so the same folder always gets the same catalog, no matter when or where the catalogs were generated.
+CATALOG_NAMESPACE = uuid5(NAMESPACE_URL, "https://github.com/Mets3D/kena_to_blender/catalogs")
+
+class AssetCatalog(NamedTuple):
+	uuid: str
+	path: str
+	simple_name: str
+
+	def to_line(self) -> str:
+		return f"{self.uuid}:{self.path}:{self.simple_name}"
+
+	@property
+	def name_chain(self) -> List[str]:
+		return self.path.split("/")
+
+def name_chain_to_catalog(name_chain: List[str]) -> Optional[AssetCatalog]:
+	if not name_chain:
+		return
+	path = "/".join(name_chain)
+	return AssetCatalog(str(uuid5(CATALOG_NAMESPACE, path)), path, "-".join(name_chain))
+
+class AssetCatalogs:
+	"""The catalogs of a catalog definition file, indexed by path and by UUID."""
+
+	def __init__(self, catalogs: List[AssetCatalog] = []):
+		self.catalogs: List[AssetCatalog] = []
+		self.by_path: Dict[str, AssetCatalog] = {}
+		self.by_uuid: Dict[str, AssetCatalog] = {}
+		self.simple_names = set()
+		# Lines of the parsed file, written back as they were, so comments and edits made in Blender survive.
+		self.file_lines: List[str] = []
+		self.file_catalog_count = 0
+		for cat in catalogs:
+			self.add(cat)
+
+	@classmethod
+	def parse(cls, contents: str) -> 'AssetCatalogs':
+		catalogs = cls()
+		for line in contents.split("\n"):
+			line = line.strip()
+			if not line or line.startswith("#") or line.startswith("VERSION"):
+				continue
+			parts = line.split(":", 2)
+			if len(parts) < 2:
+				print("Invalid catalog definition: " + line)
+				continue
+			uuid, path = parts[0], parts[1]
+			simple_name = parts[2] if len(parts) == 3 else path.replace("/", "-")
+			# Assets may already use any catalog of the file, so none of them may be dropped.
+			catalogs.add(AssetCatalog(uuid, path, simple_name), unique=False)
+		catalogs.file_lines = contents.rstrip("\n").split("\n")
+		catalogs.file_catalog_count = len(catalogs.catalogs)
+		return catalogs
+
+	@classmethod
+	def from_file(cls, filepath: str) -> 'AssetCatalogs':
+		with open(filepath) as f:
+			return cls.parse(f.read())
+
+	def write(self, filepath: str):
+		"""Write the parsed file as it was, followed by the catalogs that were added since."""
+		new_lines = [cat.to_line() for cat in self.catalogs[self.file_catalog_count:]]
+		with open(filepath, 'w') as f:
+			if self.file_lines:
+				f.write("\n".join(self.file_lines + new_lines) + "\n")
+			else:
+				f.write(ASSET_HEADER + "\n".join(new_lines))
+
+	def add(self, cat: AssetCatalog, unique=True) -> bool:
+		"""Add a catalog, unless one with the same path, UUID or simple name already exists.
+		With unique=False, the catalog is added anyway, but lookups by path keep finding the first one."""
+		if unique and (cat.path in self.by_path or cat.uuid in self.by_uuid or cat.simple_name in self.simple_names):
+			return False
+		self.catalogs.append(cat)
+		self.by_path.setdefault(cat.path, cat)
+		self.by_uuid.setdefault(cat.uuid, cat)
+		self.simple_names.add(cat.simple_name)
+		return True
+
+	def get_by_path(self, path: str) -> Optional[AssetCatalog]:
+		return self.by_path.get(path)
+
+	def get_by_name_chain(self, name_chain: List[str]) -> Optional[AssetCatalog]:
+		return self.by_path.get("/".join(name_chain))
+
+	def get_by_uuid(self, uuid: str) -> Optional[AssetCatalog]:
+		return self.by_uuid.get(uuid)
+
+	def __iter__(self) -> Iterator[AssetCatalog]:
+		return iter(self.catalogs)
+
+	def __len__(self) -> int:
+		return len(self.catalogs)
+
+class NameChainFilter:
+	"""Prefix trie of name chains, eg. [["Characters", "Kena"], ["Props"]].
+	A name chain matches if it is inside one of the filter chains, or is a parent of one,
+	just like the element by element comparison of is_good_name_chain().
+	An empty filter matches everything.
+	"""
+
+	def __init__(self, chains: List[List[str]] = []):
+		self.root = {}
+		self.empty = not chains
+		for chain in chains:
+			node = self.root
+			for name in chain:
+				node = node.setdefault(name, {})
+			# Marks the end of a chain: everything below it matches.
+			node[None] = True
+
+	def matches(self, name_chain: List[str]) -> bool:
+		if self.empty:
+			return True
+		node = self.root
+		for name in name_chain:
+			if None in node:
+				return True
+			if name not in node:
+				return False
+			node = node[name]
+		return True
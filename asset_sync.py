@@ -0,0 +1,198 @@
+from typing import List, Dict, Set
+from bpy.types import Object, Material, Operator
+from bpy.props import BoolProperty, StringProperty
+
+import bpy, os
+from datetime import datetime
+
+from .utils import get_extract_path
+from .asset_catalogs import NameChainFilter
+from .extract_files import get_material_map
+from .import_umodel_material import set_up_material, get_textures_dir, SOURCE_PATH_PROP
+from .texture_store import get_texture_store
+from .texture_proxies import FULL_RES_PATH_PROP, get_full_res_path, get_texture_resolution, apply_texture_resolution
+from .source_tracking import SOURCE_PROP, SourceChanges, get_source_tracker, string_to_sources, save_hash_caches
+from .kena_generate_catalogs import read_catalogs, reload_kena_asset, record_sources, generate_queued_previews
+
+def get_kena_assets(name_chains: List[List[str]] = []) -> List[Object]:
+	"""Return the imported assets, optionally only the ones in some catalogs."""
+	assets = [o for o in bpy.data.objects if o.asset_data and o.asset_data.author == 'Ember Labs']
+	if not name_chains:
+		return assets
+	catalogs = read_catalogs()
+	name_filter = NameChainFilter(name_chains)
+	filtered = []
+	for o in assets:
+		cat = catalogs.get_by_uuid(o.asset_data.catalog_id)
+		if cat and name_filter.matches(cat.name_chain):
+			filtered.append(o)
+	return filtered
+
+def refresh_materials(materials: Set[Material], mat_map: Dict[str, str]) -> int:
+	"""Set up materials again from their .props.txt files. Returns the number of refreshed materials."""
+	from .props_txt_to_json import props_txt_to_dict
+	count = 0
+	for mat in materials:
+		mat_file = mat_map.get(mat.name)
+		if not mat_file:
+			continue
+		set_up_material(None, mat, props_txt_to_dict(mat_file))
+		count += 1
+	return count
+
+def refresh_localized_textures(tex_paths: Set[str], extract_path: str) -> int:
+	"""Copy changed textures into the texture store next to the .blend file again, and reload their images.
+	The old copies may be shared by identical textures, so they are not overwritten.
+	Images that were already compressed to textures_compressed are left alone."""
+	textures_dir = get_textures_dir()
+	store = get_texture_store(textures_dir)
+	images = {}
+	for img in bpy.data.images:
+		full_res_path = get_full_res_path(img)
+		if not full_res_path.startswith("//textures_ue"):
+			continue
+		# Images from before the texture store don't know their source, but their path matches it.
+		source = img.get(SOURCE_PATH_PROP) or os.path.relpath(bpy.path.abspath(full_res_path), textures_dir)
+		images.setdefault(os.path.normpath(source), []).append(img)
+
+	count = 0
+	for tex_path in tex_paths:
+		src = os.path.join(extract_path, tex_path)
+		users = images.get(os.path.normpath(tex_path))
+		if not users or not os.path.isfile(src):
+			continue
+		stored_path = store.add(src, tex_path)
+		resolution = get_texture_resolution()
+		for img in users:
+			img.filepath = "//textures_ue" + os.sep + stored_path
+			if FULL_RES_PATH_PROP in img:
+				img[FULL_RES_PATH_PROP] = img.filepath
+			apply_texture_resolution(img, resolution)
+			img.reload()
+		count += 1
+	return count
+
+def sync_assets(context, name_chains: List[List[str]] = [], only_report=False) -> Dict[str, int]:
+	"""Bring the imported assets up to date with the extract folder, after a new umodel extract.
+	Assets whose .psk file changed are re-imported into the same catalog and collection,
+	materials whose .props.txt files changed are set up again, and changed textures are copied again.
+	Everything else is left untouched.
+	"""
+	extract_path = get_extract_path(context)
+	tracker = get_source_tracker(extract_path, refresh=True)
+
+	to_reimport: List[Object] = []
+	to_rematerial: Dict[Object, Set[str]] = {}
+	textures: Set[str] = set()
+	untracked: List[Object] = []
+	for o in get_kena_assets(name_chains):
+		sources = string_to_sources(o.get(SOURCE_PROP, ""))
+		if not sources:
+			untracked.append(o)
+			continue
+		changes: SourceChanges = tracker.get_changes(sources)
+		if changes.geometry:
+			to_reimport.append(o)
+			continue
+		if changes.materials:
+			to_rematerial[o] = changes.materials
+		textures.update(changes.textures)
+
+	materials = {ms.material for o, mat_names in to_rematerial.items()
+		for ms in o.material_slots if ms.material and ms.material.name in mat_names}
+	stats = {
+		'reimported' : len(to_reimport)
+		,'materials' : len(materials)
+		,'textures' : len(textures)
+		,'untracked' : len(untracked)
+	}
+	print(f"Sync: {stats['reimported']} assets to re-import, {stats['materials']} materials to set up again, "
+		f"{stats['textures']} textures to copy again, {stats['untracked']} assets without recorded sources.")
+	if only_report:
+		return stats
+
+	if context.object and context.object.mode != 'OBJECT':
+		bpy.ops.object.mode_set(mode='OBJECT')
+	for i, o in enumerate(to_reimport):
+		name = o.name
+		reload_kena_asset(context, o, extract_path)
+		now = datetime.now().strftime("%H:%M:%S")
+		print(f"{now} Re-imported {i+1}/{len(to_reimport)}: {name}")
+
+	refresh_materials(materials, tracker.resolver.mat_map)
+	stats['textures'] = refresh_localized_textures(textures, extract_path)
+
+	# Without a record, there is no telling what changed, so the current state becomes the baseline.
+	for o in list(to_rematerial.keys()) + untracked:
+		psk_path = os.path.join(extract_path, o.asset_data.description)
+		if os.path.isfile(psk_path):
+			record_sources(o, psk_path, extract_path)
+	for o in get_kena_assets(name_chains):
+		sources = string_to_sources(o.get(SOURCE_PROP, ""))
+		if sources and textures.intersection(sources['textures']):
+			record_sources(o, os.path.join(extract_path, sources['psk'][0]), extract_path)
+	save_hash_caches()
+
+	generate_queued_previews()
+	return stats
+
+class OBJECT_OT_sync_kena_assets(Operator):
+	"""Update the imported assets whose files changed in the extract folder, and nothing else"""
+	bl_idname = "object.sync_kena_assets"
+	bl_label = "Sync Kena Assets With Extract Folder"
+	bl_options = {'REGISTER', 'UNDO'}
+
+	only_report: BoolProperty(
+		name="Only Report"
+		,description="Only print what would be updated, without changing anything"
+		,default=False
+	)
+
+	def execute(self, context):
+		stats = sync_assets(context, only_report=self.only_report)
+		self.report({'INFO'}, f"Re-imported {stats['reimported']} assets, refreshed {stats['materials']} materials and {stats['textures']} textures.")
+		return {'FINISHED'}
+
+def refresh_asset_materials(context, name_chains: List[List[str]] = []) -> int:
+	"""Set up the materials of all assets again, eg. after changing the material rules
+	of import_umodel_material, without re-importing any geometry.
+	Each material is set up only once, no matter how many assets use it."""
+	extract_path = get_extract_path(context)
+	mat_map = get_material_map(extract_path, refresh=True)
+	assets = get_kena_assets(name_chains)
+	materials = {ms.material for o in assets for ms in o.material_slots if ms.material}
+	count = refresh_materials(materials, mat_map)
+
+	# Keep the recorded sources in sync, so the next sync doesn't set them up yet again.
+	tracker = get_source_tracker(extract_path, refresh=True)
+	for o in assets:
+		sources = string_to_sources(o.get(SOURCE_PROP, ""))
+		if sources:
+			record_sources(o, tracker.abs_path(sources['psk'][0]), extract_path)
+
+	now = datetime.now().strftime("%H:%M:%S")
+	print(f"{now} Set up {count} materials of {len(assets)} assets.")
+	return count
+
+class OBJECT_OT_refresh_kena_materials(Operator):
+	"""Set up the materials of the imported assets again from their .props.txt files, without re-importing their meshes"""
+	bl_idname = "object.refresh_kena_materials"
+	bl_label = "Refresh Kena Asset Materials"
+	bl_options = {'REGISTER', 'UNDO'}
+
+	catalog_path: StringProperty(
+		name="Catalog"
+		,description="Only refresh the assets in this catalog and its sub-catalogs, eg. Characters/Kena. Leave empty for all assets"
+		,default=""
+	)
+
+	def execute(self, context):
+		name_chains = [self.catalog_path.strip("/").split("/")] if self.catalog_path.strip("/") else []
+		count = refresh_asset_materials(context, name_chains)
+		self.report({'INFO'}, f"Refreshed {count} materials.")
+		return {'FINISHED'}
+
+registry = [
+	OBJECT_OT_sync_kena_assets
+	,OBJECT_OT_refresh_kena_materials
+]
@@ -1,7 +1,7 @@
-from typing import List
+from typing import List, Set, Dict, Optional, Tuple
 from bpy.types import Object
 
-import bpy, os, sys
+import bpy, os, sys, time, traceback
 from datetime import datetime
 from bpy_extras.io_utils import ImportHelper
 from bpy.props import StringProperty, BoolProperty, CollectionProperty
@@ -9,6 +9,19 @@ from bpy.props import StringProperty, BoolProperty, CollectionProperty
 from .utils import get_extract_path, is_psk
 from .cleanup_mesh import cleanup_mesh, delete_mesh_with_bad_materials
 from .import_umodel_material import load_materials_on_selected_objects
+from .import_profiler import profile_stage
+from .psk_reader import read_points
+from .import_schedule import order_jobs
+from .mesh_hash import (
+	GEOMETRY_HASH_PROP, get_geometry_hash, get_mesh_index, find_duplicate_mesh
+	,SKELETON_HASH_PROP, get_skeleton_hash, get_skeleton_index, find_duplicate_skeleton
+)
+
+# How long the non-blocking batch import may keep the interface busy on each timer tick, at least one file.
+CHUNK_SECONDS = 0.25
+# Ctrl/Cmd shortcuts that are swallowed while the non-blocking import runs: undo, redo, and new, open, revert or quit,
+# which would pull the data out from under the import between two files.
+BLOCKED_SHORTCUTS = {'Z', 'Y', 'N', 'O', 'Q'}
 
 BAD_MATS = [
 	"WorldGridMaterial"
@@ -21,28 +34,67 @@ BAD_MATS = [
 	,'lambert1'
 ]
 
-def get_object_name_list():
-	return [o.name for o in bpy.data.objects]
+def get_object_set() -> Set[Object]:
+	return set(bpy.data.objects)
 
-def get_new_objects(old_name_list: List[str]) -> List[Object]:
-	return [o for o in bpy.data.objects if o.name not in old_name_list]
+def get_object_name_set() -> Set[str]:
+	return {o.name for o in bpy.data.objects}
+
+def get_new_objects(old_objects: Set[Object]) -> List[Object]:
+	return [o for o in bpy.data.objects if o not in old_objects]
+
+DEVNULL = None
 
 def enable_print(bool):
 	"""For suppressing prints from fbx importer and remove_doubles()."""
+	global DEVNULL
 	if not bool:
-		sys.stdout = open(os.devnull, 'w')
+		if not DEVNULL:
+			DEVNULL = open(os.devnull, 'w')
+		sys.stdout = DEVNULL
 	else:
 		sys.stdout = sys.__stdout__
 
+def recover_from_failed_import(context):
+	"""Get back to a sane state after an exception was raised in the middle of an import."""
+	enable_print(True)
+	if context.object and context.object.mode != 'OBJECT':
+		bpy.ops.object.mode_set(mode='OBJECT')
+
+def roll_back_failed_import(context, old_objects: Set[Object]
+		,imported_names: Optional[Set[str]] = None
+		,mesh_index: Optional[Dict[str, str]] = None
+		,skeleton_index: Optional[Dict[str, str]] = None
+	):
+	"""Like recover_from_failed_import(), but also delete the objects created since old_objects was taken,
+	and forget their names and hashes, so the half-imported file isn't skipped when it's imported again."""
+	recover_from_failed_import(context)
+	for o in get_new_objects(old_objects):
+		if imported_names is not None:
+			imported_names.discard(o.name)
+		if skeleton_index is not None and SKELETON_HASH_PROP in o and skeleton_index.get(o[SKELETON_HASH_PROP]) == o.name:
+			del skeleton_index[o[SKELETON_HASH_PROP]]
+		data, data_type = o.data, o.type
+		bpy.data.objects.remove(o)
+		# Meshes reused from earlier files still have other users.
+		if not data or data.users > 0:
+			continue
+		if data_type == 'MESH':
+			if mesh_index is not None and GEOMETRY_HASH_PROP in data and mesh_index.get(data[GEOMETRY_HASH_PROP]) == data.name:
+				del mesh_index[data[GEOMETRY_HASH_PROP]]
+			bpy.data.meshes.remove(data)
+		elif data_type == 'ARMATURE':
+			bpy.data.armatures.remove(data)
+
 def import_psk_files(psk_files: List[str]) -> List[Object]:
 	objects = []
 	for full_path in psk_files:
 		print(full_path)
-		ob_list = get_object_name_list()
+		old_obs = get_object_set()
 		enable_print(False)
 		bpy.ops.import_scene.psk(filepath=full_path)
 		enable_print(True)
-		new_obs = get_new_objects(ob_list)
+		new_obs = get_new_objects(old_obs)
 		for o in new_obs:
 			o.name = o.name.replace(".mo", "").replace(".ao", "_Skeleton").replace("SK_", "")
 			o.data.name = o.name
@@ -79,23 +131,91 @@ def batch_import_psk_WITH_MORPHS(context, abs_path_to_extracted_files: str):
 	Then we use this function to batch import those .psk/pskx files, 
 	and merge the morphs into shape keys on a single object.
 
+	Only the base meshes are imported with the importer. Morphs are read straight from their
+	.psk files into shape keys, unless their vertices don't line up with the base mesh,
+	in which case they are imported as objects and joined as shapes, as before.
 	"""
 	for subdir, dirs, files in os.walk(abs_path_to_extracted_files):
 		psk_files = [subdir + os.sep + f for f in files if is_psk(f)]
 		if not psk_files:
 			continue
 
-		any_morphs = False
-		for filename in psk_files:
-			if "Morph" in filename:
-				any_morphs = True
-				break
-		if not any_morphs:
+		morph_files = [f for f in psk_files if "Morph" in os.path.basename(f)]
+		if not morph_files:
 			continue
+		base_files = [f for f in psk_files if f not in morph_files]
 
-		objects = import_psk_files(psk_files)
+		objects = import_psk_files(base_files)
+		base_meshes = [o for o in objects if o.type == 'MESH']
+		if len(base_files) == 1 and len(base_meshes) == 1:
+			if add_morphs_as_shape_keys(base_meshes[0], base_files[0], morph_files):
+				continue
+
+		objects.extend(import_psk_files(morph_files))
 		combine_morphs(context, objects)
 
+def get_morph_name(name: str) -> str:
+	"""Discard parts of the name up to and including "Morph"."""
+	parts = name.split("_")
+	for i, part in enumerate(parts):
+		if "Morph" in part:
+			parts = parts[i+1:]
+			break
+	return "_".join(parts)
+
+def add_morphs_as_shape_keys(obj: Object, base_filepath: str, morph_filepaths: List[str]) -> bool:
+	"""Create a shape key on obj for each morph .psk file, using only the vertex positions in the files.
+
+	The importer may scale or flip axes, so the per-axis transform from .psk space to the mesh
+	is fitted from the base .psk file, and morph offsets are converted with it.
+	Returns False without changing anything if the mesh vertices don't match the base .psk file.
+	"""
+	import numpy as np
+	mesh = obj.data
+	vert_count = len(mesh.vertices)
+	base_points = np.frombuffer(read_points(base_filepath), dtype=np.float32).reshape(-1, 3)
+	if len(base_points) != vert_count or vert_count == 0:
+		print(f"Vertex count of {obj.name} doesn't match {base_filepath}, can't read morphs directly.")
+		return False
+
+	coords = np.empty(vert_count * 3, dtype=np.float32)
+	mesh.vertices.foreach_get('co', coords)
+	coords = coords.reshape(-1, 3)
+
+	# Least squares fit of coords = base_points * scale + offset, for each axis.
+	base_mean = base_points.mean(axis=0)
+	coords_mean = coords.mean(axis=0)
+	base_centered = base_points - base_mean
+	variance = (base_centered * base_centered).sum(axis=0)
+	scale = (base_centered * (coords - coords_mean)).sum(axis=0) / np.maximum(variance, 1e-12)
+	offset = coords_mean - base_mean * scale
+
+	extent = max(float(np.ptp(coords, axis=0).max()), 1e-6)
+	error = np.abs(base_points * scale + offset - coords).max()
+	if error > extent * 1e-4:
+		print(f"Vertex order of {obj.name} doesn't match {base_filepath}, can't read morphs directly.")
+		return False
+
+	morphs = []
+	for filepath in morph_filepaths:
+		morph_points = np.frombuffer(read_points(filepath), dtype=np.float32).reshape(-1, 3)
+		if morph_points.shape != base_points.shape:
+			print(f"Vertex count of morph {filepath} doesn't match {base_filepath}, skipping.")
+			continue
+		morphs.append((filepath, morph_points))
+
+	if not mesh.shape_keys:
+		obj.shape_key_add(name="Basis", from_mix=False)
+	for filepath, morph_points in morphs:
+		name = get_morph_name(os.path.basename(filepath).split(".")[0])
+		shape_key = obj.shape_key_add(name=name, from_mix=False)
+		shape_key.data.foreach_set('co', (coords + (morph_points - base_points) * scale).ravel())
+	mesh.update()
+
+	now = datetime.now().strftime("%H:%M:%S")
+	print(f"{now} Added {len(morphs)} morphs to {obj.name}")
+	return True
+
 def combine_morphs(context, objects: List[Object]):
 	"""
 	objects is expected to be a list of imported armatures and meshes.
@@ -112,13 +232,7 @@ def combine_morphs(context, objects: List[Object]):
 			objects.remove(o)
 			objects.remove(o.parent)
 		else:
-			parts = o.name.split("_")
-			for i, part in enumerate(parts):
-				if "Morph" in part:
-					# Discard parts of the name up to and including "Morph"
-					parts = parts[i+1:]
-					break
-			o.name = "_".join(parts)
+			o.name = get_morph_name(o.name)
 
 	bpy.ops.object.join_shapes()
 	for o in objects[:]:
@@ -126,42 +240,133 @@ def combine_morphs(context, objects: List[Object]):
 
 	bpy.ops.outliner.orphans_purge(do_recursive=True)
 
-def import_kena_psk(context, filepath: str, do_clean_mesh=True) -> List[Object]:
-	ob_list = get_object_name_list()
+def reuse_duplicate_mesh(ob: Object, mesh_index: Dict[str, str]) -> Tuple[bool, str]:
+	"""If an identical mesh was already imported and cleaned up, use that on the object instead.
+	Returns whether the mesh was replaced, and the geometry hash of the imported mesh.
+	Meshes with vertex groups are left alone and aren't hashed, since their weights aren't part of the hash,
+	so their hash is an empty string.
+	"""
+	if ob.vertex_groups:
+		return False, ""
+	geometry_hash = get_geometry_hash(ob.data)
+	existing = find_duplicate_mesh(mesh_index, geometry_hash)
+	if not existing:
+		return False, geometry_hash
+	imported_mesh = ob.data
+	imported_mats = [m for m in imported_mesh.materials if m]
+	ob.data = existing
+	bpy.data.meshes.remove(imported_mesh)
+	for mat in imported_mats:
+		if mat.users == 0:
+			bpy.data.materials.remove(mat)
+	return True, geometry_hash
+
+def reuse_shared_skeleton(arm_ob: Object, skeleton_index: Dict[str, str]) -> Optional[Object]:
+	"""Many characters share the same skeleton. If an identical one was already imported,
+	move the children of arm_ob over to it and delete arm_ob.
+	Returns the armature the children ended up on, or None if arm_ob was kept.
+	"""
+	skeleton_hash = get_skeleton_hash(arm_ob.data)
+	shared = find_duplicate_skeleton(skeleton_index, skeleton_hash, ignore=arm_ob)
+	if not shared:
+		arm_ob[SKELETON_HASH_PROP] = skeleton_hash
+		skeleton_index[skeleton_hash] = arm_ob.name
+		return None
+
+	# Keep the children where they are, even if the shared armature was moved.
+	to_shared = shared.matrix_world.inverted() @ arm_ob.matrix_world
+	for child in arm_ob.children:
+		child.parent = shared
+		child.matrix_parent_inverse = to_shared @ child.matrix_parent_inverse
+		for mod in child.modifiers:
+			if mod.type == 'ARMATURE' and mod.object == arm_ob:
+				mod.object = shared
+
+	armature = arm_ob.data
+	bpy.data.objects.remove(arm_ob)
+	if armature.users == 0:
+		bpy.data.armatures.remove(armature)
+	return shared
+
+def import_kena_psk(context, filepath: str, do_clean_mesh=True
+		,imported_names: Optional[Set[str]] = None
+		,mesh_index: Optional[Dict[str, str]] = None
+		,skeleton_index: Optional[Dict[str, str]] = None
+	) -> List[Object]:
+	"""Import a .psk file and set up its meshes and materials.
+	When importing many files, pass a set of object names from get_object_name_set() as imported_names,
+	the geometry hashes of get_mesh_index() as mesh_index, and the skeleton hashes of get_skeleton_index()
+	as skeleton_index, so they don't have to be rebuilt for every file.
+	They are kept up to date with the new objects.
+	"""
 	ob_name = os.path.basename(filepath).split(".")[0]
-	if ob_name in ob_list:
+	if imported_names is None:
+		already_imported = ob_name in bpy.data.objects
+	else:
+		already_imported = ob_name in imported_names
+	if already_imported:
 		print("Already imported, skipping:", ob_name)
 		return []
 
 	root_path = get_extract_path(context)
+	if mesh_index is None:
+		mesh_index = get_mesh_index()
+	if skeleton_index is None:
+		skeleton_index = get_skeleton_index()
+	old_obs = get_object_set()
 	enable_print(False)
-	bpy.ops.import_scene.psk(filepath=filepath)
-	new_obs = get_new_objects(ob_list)
-	for o in new_obs:
+	with profile_stage("import_psk"):
+		bpy.ops.import_scene.psk(filepath=filepath)
+	new_obs = get_new_objects(old_obs)
+	for o in new_obs[:]:
 		o.name = o.name.replace(".mo", "").replace(".ao", "_Skeleton").replace("SK_", "")
 		o.data.name = o.name
+		if o.type == 'ARMATURE':
+			with profile_stage("reuse_shared_skeleton"):
+				if reuse_shared_skeleton(o, skeleton_index):
+					new_obs.remove(o)
+					continue
+		if imported_names is not None:
+			imported_names.add(o.name)
 
+	for o in new_obs:
 		if o.type != 'MESH':
 			continue
 
+		with profile_stage("reuse_duplicate_mesh"):
+			reused, geometry_hash = reuse_duplicate_mesh(o, mesh_index)
+		if reused:
+			# Already cleaned up and with materials loaded.
+			continue
+
 		bpy.ops.object.select_all(action='DESELECT')
 		context.view_layer.objects.active = o
 		o.select_set(True)
-		delete_mesh_with_bad_materials(context, o, BAD_MATS)
+		with profile_stage("delete_mesh_with_bad_materials"):
+			delete_mesh_with_bad_materials(context, o, BAD_MATS)
 
 		if len(o.data.vertices) == 0:
 			for o in new_obs:
+				if imported_names is not None:
+					imported_names.discard(o.name)
 				bpy.data.objects.remove(o)
-			return
+			enable_print(True)
+			return []
 
 		bpy.ops.object.shade_smooth()
-		cleanup_mesh(context, o
-			,remove_doubles = True
-			,quadrangulate = True
-			,weight_normals = True
-			,seams_from_islands = True
-		)
-		load_materials_on_selected_objects(context)
+		with profile_stage("cleanup_mesh"):
+			cleanup_mesh(context, o
+				,remove_doubles = True
+				,quadrangulate = True
+				,weight_normals = True
+				,seams_from_islands = True
+			)
+		with profile_stage("load_materials_on_selected_objects"):
+			load_materials_on_selected_objects(context)
+
+		if geometry_hash:
+			o.data[GEOMETRY_HASH_PROP] = geometry_hash
+			mesh_index[geometry_hash] = o.data.name
 
 	enable_print(True)
 	now = datetime.now().strftime("%H:%M:%S")
@@ -199,7 +404,13 @@ class WM_OT_batch_import_psk(bpy.types.Operator, ImportHelper):
 		description = "Meshes will have Remove Doubles, Merge By Distance, Weight Normals and Seams From Islands executed on them"
 	)
 
-	def execute(self, context):
+	non_blocking: BoolProperty(
+		name = "Non-Blocking",
+		default = True,
+		description = "Import a few files at a time while keeping the interface responsive. Press Esc to stop after the current file"
+	)
+
+	def get_paths(self) -> List[str]:
 		paths = [os.path.join(self.directory, name.name)
 			for name in self.files]
 
@@ -208,9 +419,102 @@ class WM_OT_batch_import_psk(bpy.types.Operator, ImportHelper):
 			for subdir, dirs, files in os.walk(self.directory):
 				paths.extend([subdir+os.sep+filename for filename in files if is_psk(filename)])
 
-		for filepath in paths:
-			import_kena_psk(context, filepath, do_clean_mesh=self.do_clean_mesh)
+		return [job[0] for job in order_jobs([(path,) for path in paths if is_psk(path)])]
+
+	def execute(self, context):
+		paths = self.get_paths()
+		imported_names = get_object_name_set()
+		mesh_index = get_mesh_index()
+		skeleton_index = get_skeleton_index()
+
+		if not self.non_blocking or not context.window:
+			for filepath in paths:
+				import_kena_psk(context, filepath, do_clean_mesh=self.do_clean_mesh
+					,imported_names=imported_names, mesh_index=mesh_index, skeleton_index=skeleton_index)
+			return {'FINISHED'}
+
+		self._paths = paths
+		self._next = 0
+		self._failed = []
+		self._cancelled = False
+		self._imported_names = imported_names
+		self._mesh_index = mesh_index
+		self._skeleton_index = skeleton_index
+
+		wm = context.window_manager
+		wm.progress_begin(0, len(paths))
+		self._timer = wm.event_timer_add(0.01, window=context.window)
+		wm.modal_handler_add(self)
+		self.update_status(context)
+		return {'RUNNING_MODAL'}
+
+	def modal(self, context, event):
+		if event.type == 'ESC' and event.value == 'PRESS':
+			# Files are imported one by one between events, so this can only stop in between two files.
+			self._cancelled = True
+			context.workspace.status_text_set("Batch import: stopping...")
+			return {'RUNNING_MODAL'}
+		if event.type in BLOCKED_SHORTCUTS and (event.ctrl or event.oskey):
+			self.report({'WARNING'}, "Batch import is running, press Esc to stop it first.")
+			return {'RUNNING_MODAL'}
+		if event.type != 'TIMER':
+			return {'PASS_THROUGH'}
+
+		# Each file sets up its own selection, but it has to start in Object Mode.
+		if context.object and context.object.mode != 'OBJECT':
+			bpy.ops.object.mode_set(mode='OBJECT')
+
+		start = time.time()
+		while not self._cancelled and self._next < len(self._paths):
+			self.import_file(context, self._paths[self._next])
+			self._next += 1
+			if time.time() - start >= CHUNK_SECONDS:
+				break
+
+		context.window_manager.progress_update(self._next)
+		if self._cancelled or self._next >= len(self._paths):
+			return self.finish(context)
+		self.update_status(context)
+		return {'RUNNING_MODAL'}
+
+	def import_file(self, context, filepath: str):
+		"""A failed file shouldn't stop the batch, or leave half-built objects that make a later run skip it."""
+		old_objects = get_object_set()
+		try:
+			import_kena_psk(context, filepath, do_clean_mesh=self.do_clean_mesh
+				,imported_names=self._imported_names, mesh_index=self._mesh_index, skeleton_index=self._skeleton_index)
+		except Exception:
+			roll_back_failed_import(context, old_objects, self._imported_names, self._mesh_index, self._skeleton_index)
+			traceback.print_exc()
+			self._failed.append(filepath)
+
+	def update_status(self, context):
+		context.workspace.status_text_set(
+			f"Batch import: {self._next}/{len(self._paths)} files, {len(self._failed)} failed. Esc to stop after the current file"
+		)
 
+	def clean_up(self, context):
+		wm = context.window_manager
+		wm.event_timer_remove(self._timer)
+		wm.progress_end()
+		context.workspace.status_text_set(None)
+
+	def cancel(self, context):
+		"""Called by Blender instead of modal() when the operator is aborted, eg. when the window closes."""
+		self.clean_up(context)
+		print(f"Batch import aborted after {self._next}/{len(self._paths)} files.")
+
+	def finish(self, context):
+		self.clean_up(context)
+
+		for filepath in self._failed:
+			print("Failed to import: ", filepath)
+		report = f"Imported {self._next}/{len(self._paths)} files, {len(self._failed)} failed."
+		if self._cancelled:
+			# Files that were already imported are skipped by name, so running the import again continues from here.
+			report = "Stopped. " + report + " Import the same files again to continue."
+		self.report({'WARNING'} if self._failed else {'INFO'}, report)
+		# Even when stopped, what was imported should be a single undo step.
 		return {'FINISHED'}
 
 def menu_func_import(self, context):
@@ -0,0 +1,61 @@
+# Benchmark of finding the folders that contain .psk files, which is what catalog generation spends its time on.
+# Compares the single bottom-up walk against the previous approach of walking each folder's whole
+# sub-tree again. Runs without Blender:
+#   python bench_catalog_walk.py [depth] [breadth]
+
+import os, sys, time, shutil, tempfile
+
+try:
+	from .extract_files import is_psk, find_folders_with_psk
+except ImportError:
+	from extract_files import is_psk, find_folders_with_psk
+
+def build_synthetic_tree(root: str, depth: int, breadth: int):
+	"""Every folder has `breadth` sub-folders down to `depth`. Only the leaves of the first branch have .psk files,
+	so most of the tree has to be searched to the bottom to find out it has none."""
+	def build(folder, level, has_psk_branch):
+		if level == depth:
+			if has_psk_branch:
+				open(os.path.join(folder, "SM_Prop.pskx"), 'w').close()
+			open(os.path.join(folder, "SM_Prop.props.txt"), 'w').close()
+			return
+		for i in range(breadth):
+			sub = os.path.join(folder, f"Folder_{i}")
+			os.makedirs(sub)
+			build(sub, level+1, has_psk_branch and i == 0)
+	build(root, 0, True)
+
+def find_folders_with_psk_per_folder_walk(root_dir: str):
+	"""The previous implementation: for every folder, walk its entire sub-tree."""
+	def has_psk_in_any_subfolder(folder) -> bool:
+		for subdir, dirs, files in os.walk(folder):
+			for f in files:
+				if is_psk(f):
+					return True
+		return False
+	return [subdir for subdir, dirs, files in os.walk(root_dir) if has_psk_in_any_subfolder(subdir)]
+
+def benchmark(depth=6, breadth=4):
+	root = tempfile.mkdtemp()
+	try:
+		build_synthetic_tree(root, depth, breadth)
+		folder_count = sum(1 for _ in os.walk(root))
+
+		start = time.perf_counter()
+		old = find_folders_with_psk_per_folder_walk(root)
+		old_time = time.perf_counter() - start
+
+		start = time.perf_counter()
+		new = find_folders_with_psk(root)
+		new_time = time.perf_counter() - start
+
+		assert set(old) == set(new), "The two implementations found different folders!"
+		print(f"{folder_count} folders, depth {depth}, breadth {breadth}, {len(new)} with .psk files")
+		print(f"    Walk per folder: {old_time:.3f}s")
+		print(f"    Bottom-up walk:  {new_time:.3f}s ({old_time/max(new_time, 1e-9):.1f}x faster)")
+	finally:
+		shutil.rmtree(root)
+
+if __name__ == "__main__":
+	args = [int(a) for a in sys.argv[1:3]]
+	benchmark(*args)
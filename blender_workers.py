@@ -0,0 +1,84 @@
+# Helpers for running functions of this addon in headless Blender processes.
+# Nothing in here may import bpy at module level, so that the coordinating process
+# doesn't have to be Blender.
+
+from typing import List, Dict, Tuple, Callable, Optional
+import os, subprocess, time
+
+ADDON_PACKAGE = __package__ or os.path.basename(os.path.dirname(os.path.realpath(__file__)))
+# The folder the addon is in, so workers can also find it when it runs from a checkout that isn't installed.
+ADDON_PARENT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+def get_blender_binary() -> str:
+	try:
+		import bpy
+		return bpy.app.binary_path
+	except ImportError:
+		return os.environ.get("BLENDER", "blender")
+
+def worker_command(
+		module: str
+		,function: str
+		,job_path: str
+		,*
+		,blend_path: str = ""
+		,factory_startup = False
+		,enable_addon = True
+		,blender_binary: str = ""
+	) -> List[str]:
+	"""Build the command line that runs module.function(job_path) in a background Blender.
+	The addon is enabled explicitly, so the worker doesn't depend on it being enabled in the user prefs.
+	Workers that don't need its operators or handlers can skip enabling it, and only import their own module.
+	factory_startup is faster, but it also means other addons (eg. the .psk importer) won't be available.
+	"""
+	enable = f"addon_utils.enable({ADDON_PACKAGE!r}, default_set=False);" if enable_addon else ""
+	expr = (
+		"import addon_utils, importlib, sys;"
+		f"{ADDON_PARENT_DIR!r} in sys.path or sys.path.append({ADDON_PARENT_DIR!r});"
+		+ enable +
+		f"importlib.import_module({ADDON_PACKAGE + '.' + module!r}).{function}({job_path!r})"
+	)
+	cmd = [blender_binary or get_blender_binary(), "-b"]
+	if factory_startup:
+		cmd.append("--factory-startup")
+	if blend_path:
+		cmd.append(blend_path)
+	cmd += ["--python-exit-code", "1", "--python-expr", expr]
+	return cmd
+
+def run_worker_pool(
+		commands: List[Tuple[str, List[str], str]]
+		,max_workers: int
+		,on_poll: Optional[Callable[[Dict[str, int]], None]] = None
+		,poll_interval = 2.0
+	) -> Dict[str, int]:
+	"""Run (key, command, log_path) tuples with at most max_workers processes at a time.
+	Each process' output goes to its log file.
+	on_poll is called regularly with the return codes of the finished processes so far.
+	Returns the return code of each process by key.
+	"""
+	pending = list(commands)
+	running = {}
+	return_codes = {}
+	max_workers = max(1, max_workers)
+
+	while pending or running:
+		while pending and len(running) < max_workers:
+			key, cmd, log_path = pending.pop(0)
+			log = open(log_path, 'w')
+			running[key] = (subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT), log)
+
+		for key, (proc, log) in list(running.items()):
+			code = proc.poll()
+			if code is None:
+				continue
+			log.close()
+			return_codes[key] = code
+			del running[key]
+
+		if on_poll:
+			on_poll(return_codes)
+		if running:
+			time.sleep(poll_interval)
+
+	return return_codes
@@ -3,7 +3,6 @@ from bpy.types import Operator, Object
 from bpy.props import BoolProperty
 from math import pi
 from mathutils import Vector
-import bmesh
 from typing import List
 
 def cleanup_mesh(context
@@ -52,6 +51,7 @@ def cleanup_mesh(context
 	### Removing useless UVMaps
 	mesh = obj.data
 	if clear_unused_UVs:
+		import bmesh
 		bm = bmesh.from_edit_mesh(mesh)
 
 		for uv_idx in reversed(range(0, len(mesh.uv_layers))):			# For each UV layer
@@ -0,0 +1,201 @@
+from typing import List, Dict, Set
+from bpy.types import Object, Material, Operator
+from bpy.props import BoolProperty
+
+import bpy, os
+
+from .source_tracking import SOURCE_PROP, string_to_sources
+from .texture_proxies import get_full_res_path
+from .texture_store import STORE_INDEX_FILENAME
+
+LOCAL_TEXTURE_DIRS = ["textures_ue", "textures_compressed"]
+
+def add_link(mapping: Dict[str, Set[str]], key: str, value: str):
+	mapping.setdefault(key, set()).add(value)
+
+def remove_links(mapping: Dict[str, Set[str]], reverse: Dict[str, Set[str]], key: str):
+	"""Remove a key from a mapping, and the key from the sets of the reverse mapping."""
+	for value in mapping.pop(key, ()):
+		users = reverse.get(value)
+		if users:
+			users.discard(key)
+			if not users:
+				del reverse[value]
+
+class DependencyIndex:
+	"""Which images, materials, objects, catalogs and .props.txt files use each other, by name,
+	built in a single pass over bpy.data, instead of scanning every node of every material for each question.
+
+	After changing a material or an object, call update_material() or update_object() to keep it up to date.
+	"""
+
+	def __init__(self):
+		self.material_images: Dict[str, Set[str]] = {}
+		self.image_materials: Dict[str, Set[str]] = {}
+		self.object_materials: Dict[str, Set[str]] = {}
+		self.material_objects: Dict[str, Set[str]] = {}
+		self.object_catalog: Dict[str, str] = {}
+		self.catalog_objects: Dict[str, Set[str]] = {}
+		self.props_materials: Dict[str, Set[str]] = {}	# .props.txt path relative to the extract folder.
+		self.material_props: Dict[str, Set[str]] = {}
+		self.object_sourced_materials: Dict[str, Set[str]] = {}	# Materials whose .props.txt files an object recorded.
+		self.sourced_material_objects: Dict[str, Set[str]] = {}
+		self.material_alpha_images: Dict[str, Set[str]] = {}		# Images whose alpha output a material uses.
+		self.alpha_image_materials: Dict[str, Set[str]] = {}
+
+	@classmethod
+	def build(cls) -> 'DependencyIndex':
+		index = cls()
+		for mat in bpy.data.materials:
+			index.update_material(mat)
+		for ob in bpy.data.objects:
+			index.update_object(ob)
+		return index
+
+	def update_material(self, mat: Material):
+		remove_links(self.material_images, self.image_materials, mat.name)
+		remove_links(self.material_alpha_images, self.alpha_image_materials, mat.name)
+		if not mat.node_tree:
+			return
+		for node in mat.node_tree.nodes:
+			if node.type != 'TEX_IMAGE' or not node.image:
+				continue
+			add_link(self.material_images, mat.name, node.image.name)
+			add_link(self.image_materials, node.image.name, mat.name)
+			if node.outputs[1].is_linked:
+				add_link(self.material_alpha_images, mat.name, node.image.name)
+				add_link(self.alpha_image_materials, node.image.name, mat.name)
+
+	def update_object(self, ob: Object):
+		self.remove_object(ob.name)
+		for ms in ob.material_slots:
+			if ms.material:
+				add_link(self.object_materials, ob.name, ms.material.name)
+				add_link(self.material_objects, ms.material.name, ob.name)
+		if ob.asset_data:
+			self.object_catalog[ob.name] = ob.asset_data.catalog_id
+			add_link(self.catalog_objects, ob.asset_data.catalog_id, ob.name)
+
+		# Which .props.txt files the materials were made from is only known from the recorded sources.
+		sources = string_to_sources(ob.get(SOURCE_PROP, ""))
+		if sources:
+			for mat_name, props in sources['materials'].items():
+				add_link(self.object_sourced_materials, ob.name, mat_name)
+				add_link(self.sourced_material_objects, mat_name, ob.name)
+				for rel_path in props:
+					add_link(self.props_materials, rel_path, mat_name)
+					add_link(self.material_props, mat_name, rel_path)
+
+	def remove_object(self, ob_name: str):
+		remove_links(self.object_materials, self.material_objects, ob_name)
+		cat_id = self.object_catalog.pop(ob_name, None)
+		if cat_id in self.catalog_objects:
+			self.catalog_objects[cat_id].discard(ob_name)
+		# Other objects with the same material recorded the same .props.txt files.
+		for mat_name in self.object_sourced_materials.pop(ob_name, ()):
+			recorders = self.sourced_material_objects[mat_name]
+			recorders.discard(ob_name)
+			if not recorders:
+				del self.sourced_material_objects[mat_name]
+				remove_links(self.material_props, self.props_materials, mat_name)
+
+	@property
+	def images_with_alpha(self) -> Set[str]:
+		"""Images whose alpha output is used by some material."""
+		return set(self.alpha_image_materials)
+
+	def image_users(self, image_name: str) -> Set[str]:
+		"""Names of the objects that use an image."""
+		return {ob_name for mat_name in self.image_materials.get(image_name, ())
+			for ob_name in self.material_objects.get(mat_name, ())}
+
+	def image_catalogs(self, image_name: str) -> Set[str]:
+		"""Catalog IDs of the assets that use an image."""
+		return {self.object_catalog[ob_name] for ob_name in self.image_users(image_name) if ob_name in self.object_catalog}
+
+	def props_users(self, rel_path: str) -> Set[str]:
+		"""Names of the materials that were made from a .props.txt file, directly or as a parent."""
+		return set(self.props_materials.get(rel_path, ()))
+
+	def asset_dependencies(self, ob_name: str) -> Dict[str, Set[str]]:
+		"""Everything an object needs: its materials, their images and .props.txt files."""
+		materials = self.object_materials.get(ob_name, set())
+		return {
+			'materials' : set(materials)
+			,'images' : {img for mat in materials for img in self.material_images.get(mat, ())}
+			,'props' : {props for mat in materials for props in self.material_props.get(mat, ())}
+		}
+
+	def unused_images(self) -> List[str]:
+		"""Names of imported textures that no material of any object uses."""
+		return [img.name for img in bpy.data.images
+			if get_full_res_path(img).startswith("//textures") and not img.library and not img.use_fake_user
+			and not any(self.material_objects.get(mat) for mat in self.image_materials.get(img.name, ()))]
+
+	def unused_texture_files(self) -> List[str]:
+		"""Files in the local texture folders next to the .blend file that no image points to."""
+		used = {os.path.normpath(bpy.path.abspath(get_full_res_path(img))) for img in bpy.data.images if img.filepath}
+		blend_dir = os.path.dirname(bpy.data.filepath)
+		unused = []
+		for dir_name in LOCAL_TEXTURE_DIRS:
+			for subdir, dirs, files in os.walk(os.path.join(blend_dir, dir_name)):
+				for filename in files:
+					# The index, and the temporary files it is written through.
+					if filename.startswith(STORE_INDEX_FILENAME):
+						continue
+					filepath = os.path.normpath(os.path.join(subdir, filename))
+					if filepath not in used:
+						unused.append(filepath)
+		return unused
+
+def get_blend_files_sharing_textures() -> List[str]:
+	"""Other .blend files next to this one, eg. the library files of import_library(), use the same texture folders."""
+	blend_dir = os.path.dirname(bpy.data.filepath)
+	this_file = os.path.normpath(bpy.data.filepath)
+	return [os.path.join(blend_dir, f) for f in sorted(os.listdir(blend_dir))
+		if f.endswith(".blend") and os.path.normpath(os.path.join(blend_dir, f)) != this_file]
+
+def clean_unused_textures(delete_files=False) -> int:
+	"""Remove images that no asset uses, and report or delete local texture files that no image points to."""
+	index = DependencyIndex.build()
+	image_names = index.unused_images()
+	for name in image_names:
+		bpy.data.images.remove(bpy.data.images[name])
+	print(f"Removed {len(image_names)} unused images.")
+
+	unused_files = index.unused_texture_files()
+	sharing_files = get_blend_files_sharing_textures()
+	if delete_files and sharing_files:
+		# Only this file's images are known, so textures used only by the other files would look unused.
+		print(f"Not deleting any files, since the texture folders are shared with {len(sharing_files)} other .blend files:")
+		for filepath in sharing_files:
+			print("    ", filepath)
+		delete_files = False
+	for filepath in unused_files:
+		if delete_files:
+			os.remove(filepath)
+			print("Deleted file: ", filepath)
+		else:
+			print("Unused file: ", filepath)
+	return len(image_names)
+
+class FILE_OT_clean_unused_kena_textures(Operator):
+	"""Remove images that no asset uses, and find texture files next to the .blend file that no image uses"""
+	bl_idname = "file.clean_unused_kena_textures"
+	bl_label = "Clean Unused Kena Textures"
+	bl_options = {'REGISTER', 'UNDO'}
+
+	delete_files: BoolProperty(
+		name="Delete Files"
+		,description="Delete the unused texture files, instead of only printing them. Nothing is deleted while other .blend files share the texture folders"
+		,default=False
+	)
+
+	def execute(self, context):
+		count = clean_unused_textures(self.delete_files)
+		self.report({'INFO'}, f"Removed {count} unused images.")
+		return {'FINISHED'}
+
+registry = [
+	FILE_OT_clean_unused_kena_textures
+]
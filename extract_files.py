@@ -0,0 +1,134 @@
+# Helpers for walking the folder that umodel extracted the game files into.
+# Nothing in here may import bpy, so that it can also be used outside of Blender,
+# eg. by the process that coordinates headless import workers.
+
+from typing import List, Dict, Tuple, Optional
+import os, json
+
+try:
+	from .asset_catalogs import AssetCatalog, AssetCatalogs, NameChainFilter
+except ImportError:
+	from asset_catalogs import AssetCatalog, AssetCatalogs, NameChainFilter
+
+def is_psk(filename):
+	return filename.endswith(".psk") or filename.endswith(".pskx")
+
+def folder_path_to_catalog_name_chain(folder_path: str) -> List[str]:
+	folder_path = folder_path.strip(os.sep)
+	if not folder_path:
+		return []
+	folders = folder_path.split(os.sep)
+	return [f.replace("_", " ").title() for f in folders]
+
+def find_folders_with_psk(root_dir: str) -> List[str]:
+	"""Return every folder under root_dir that has a .psk file in it or in any of its sub-folders.
+	This is a single bottom-up walk, where each folder passes its result up to its parent.
+	Parents come before their children in the returned list.
+	"""
+	has_psk = set()
+	folders = []
+	for subdir, dirs, files in os.walk(root_dir, topdown=False):
+		if subdir in has_psk or any(is_psk(f) for f in files):
+			has_psk.add(subdir)
+			has_psk.add(os.path.dirname(subdir))
+			folders.append(subdir)
+	# The walk went bottom-up, so this puts parents first.
+	folders.reverse()
+	return folders
+
+def is_good_name_chain(name_chain: List[str], good_chains: List[List[str]]) -> bool:
+	for good_chain in good_chains:
+		match = True
+		for name1, name2 in zip(good_chain, name_chain):
+			if name1 != name2:
+				match = False
+		if match:
+			return True
+	return False
+
+def find_psk_files_to_import(
+		extract_path: str
+		,catalogs: AssetCatalogs
+		,name_chains: List[List[str]]=[]
+	) -> List[Tuple[str, AssetCatalog]]:
+	"""Walk the extract folder and return a (filepath, catalog) tuple
+	for every .psk file that belongs to a catalog.
+	If name_chains is provided, only folders matching one of them are included.
+	"""
+	extract_path = os.path.abspath(extract_path)
+	name_filter = NameChainFilter(name_chains)
+	jobs = []
+	for subdir, dirs, files in os.walk(extract_path):
+		catalog_path = subdir.replace(extract_path, "")
+		name_chain = folder_path_to_catalog_name_chain(catalog_path)
+		if not name_chain:
+			continue
+		if not name_filter.matches(name_chain):
+			# If this folder doesn't match, none of its sub-folders will.
+			dirs.clear()
+			continue
+		cat = catalogs.get_by_name_chain(name_chain)
+		if not cat:
+			continue
+
+		for filename in files:
+			if is_psk(filename):
+				jobs.append((os.path.join(subdir, filename), cat))
+
+	return jobs
+
+def build_material_map(path_to_files: str) -> Dict[str, str]:
+	"""
+	The meshes imported by the .psk importer have materials named according to the
+	material files (.props.txt) that were extracted by umodel.
+	To match the material to the correct file quicker, we build a mapping from
+	material name to filepath in one go.
+	"""
+
+	# NOTE: This currently catches .props.txt files that are for meshes, not materials, 
+	# but it shouldn't cause any problems because there shouldn't be a name overlap...
+
+	mat_map = {}
+
+	for subdir, dirs, files in os.walk(path_to_files):
+		mat_files = [f for f in files if f.endswith('.props.txt')]
+		for mat_file in mat_files:
+			mat_map[mat_file.replace(".props.txt", "")] = subdir + os.sep + mat_file
+
+	return mat_map
+
+MATERIAL_MAPS: Dict[str, Dict[str, str]] = {}
+
+# Path of a material index written by save_material_map(). When set, get_material_map() reads it
+# instead of walking the extract folder, which is what every background worker would otherwise do on its own.
+MATERIAL_INDEX_ENV = "KENA_MATERIAL_INDEX"
+
+def get_material_map(extract_path: str, refresh=False) -> Dict[str, str]:
+	"""Cached build_material_map(), since walking the whole extract folder for every imported file adds up.
+	Use refresh=True after the contents of the extract folder changed."""
+	extract_path = os.path.abspath(extract_path)
+	if refresh or extract_path not in MATERIAL_MAPS:
+		mat_map = None if refresh else load_material_map(extract_path, os.environ.get(MATERIAL_INDEX_ENV, ""))
+		MATERIAL_MAPS[extract_path] = mat_map if mat_map is not None else build_material_map(extract_path)
+	return MATERIAL_MAPS[extract_path]
+
+def save_material_map(extract_path: str, index_path: str) -> int:
+	"""Walk the extract folder and write the material map to a JSON file. Returns the number of materials."""
+	mat_map = get_material_map(extract_path, refresh=True)
+	with open(index_path, 'w') as f:
+		json.dump({'extract_path' : os.path.abspath(extract_path), 'materials' : mat_map}, f)
+	return len(mat_map)
+
+def load_material_map(extract_path: str, index_path: str) -> Optional[Dict[str, str]]:
+	"""Read a material map written by save_material_map(), if it exists and belongs to the same extract folder."""
+	if not index_path or not os.path.isfile(index_path):
+		return None
+	try:
+		with open(index_path) as f:
+			index = json.load(f)
+	except ValueError:
+		print("Corrupt material index, ignoring it: " + index_path)
+		return None
+	if index.get('extract_path') != os.path.abspath(extract_path):
+		return None
+	return index['materials']
@@ -0,0 +1,264 @@
+# Minimal reader for the skeletal animations of .gltf/.glb files, like the ones exported by ACLViewer.
+# Meshes, materials and everything else are ignored. Nothing in here may import bpy.
+
+from typing import Dict, List, Tuple, NamedTuple
+import os, json, base64, struct
+import numpy as np
+
+COMPONENT_TYPES = {
+	5120 : np.int8
+	,5121 : np.uint8
+	,5122 : np.int16
+	,5123 : np.uint16
+	,5125 : np.uint32
+	,5126 : np.float32
+}
+TYPE_SIZES = {'SCALAR' : 1, 'VEC2' : 2, 'VEC3' : 3, 'VEC4' : 4, 'MAT4' : 16}
+
+GLB_MAGIC = 0x46546C67
+GLB_JSON_CHUNK = 0x4E4F534A
+GLB_BIN_CHUNK = 0x004E4942
+
+class BoneChannel(NamedTuple):
+	bone: str
+	path: str				# 'location', 'rotation_quaternion' or 'scale'
+	times: np.ndarray		# Seconds, shape (N,)
+	values: np.ndarray		# Shape (N, 3) or (N, 4)
+	interpolation: str		# 'LINEAR', 'STEP' or 'CUBICSPLINE'
+
+def load_gltf(filepath: str) -> Tuple[Dict, List[bytes]]:
+	"""Return the JSON part of a .gltf or .glb file, and the contents of its buffers."""
+	with open(filepath, 'rb') as f:
+		data = f.read()
+
+	glb_bin = b""
+	if len(data) >= 12 and struct.unpack_from("<I", data)[0] == GLB_MAGIC:
+		offset = 12
+		gltf = {}
+		while offset + 8 <= len(data):
+			length, chunk_type = struct.unpack_from("<II", data, offset)
+			chunk = data[offset+8 : offset+8+length]
+			if chunk_type == GLB_JSON_CHUNK:
+				gltf = json.loads(chunk)
+			elif chunk_type == GLB_BIN_CHUNK:
+				glb_bin = chunk
+			offset += 8 + length
+	else:
+		gltf = json.loads(data)
+
+	buffers = []
+	for buffer in gltf.get('buffers', []):
+		uri = buffer.get('uri')
+		if uri is None:
+			buffers.append(glb_bin)
+		elif uri.startswith("data:"):
+			buffers.append(base64.b64decode(uri.split(",", 1)[1]))
+		else:
+			with open(os.path.join(os.path.dirname(filepath), uri), 'rb') as f:
+				buffers.append(f.read())
+	return gltf, buffers
+
+def read_accessor(gltf: Dict, buffers: List[bytes], index: int) -> np.ndarray:
+	"""Return the elements of an accessor as an array of shape (count, components)."""
+	accessor = gltf['accessors'][index]
+	dtype = np.dtype(COMPONENT_TYPES[accessor['componentType']]).newbyteorder('<')
+	components = TYPE_SIZES[accessor['type']]
+	count = accessor['count']
+	if 'bufferView' not in accessor:
+		return np.zeros((count, components), dtype=np.float32)
+
+	view = gltf['bufferViews'][accessor['bufferView']]
+	buffer = buffers[view['buffer']]
+	offset = view.get('byteOffset', 0) + accessor.get('byteOffset', 0)
+	stride = view.get('byteStride', 0) or dtype.itemsize * components
+
+	values = np.ndarray(
+		(count, components)
+		,dtype=dtype
+		,buffer=buffer
+		,offset=offset
+		,strides=(stride, dtype.itemsize)
+	).astype(np.float32)
+	if accessor.get('normalized') and dtype.kind in 'iu':
+		values /= np.iinfo(dtype).max
+	return values
+
+# Converts glTF's Y-up axes to Blender's Z-up axes: (x, y, z) -> (x, -z, y).
+Y_UP_TO_Z_UP = np.array((
+	(1, 0, 0, 0)
+	,(0, 0, -1, 0)
+	,(0, 1, 0, 0)
+	,(0, 0, 0, 1)
+), dtype=np.float64)
+
+class BoneRest(NamedTuple):
+	matrix: np.ndarray			# Rest matrix of the bone in world space, shape (4, 4)
+	parent: str					# Name of the parent bone, or ""
+
+def quat_to_matrix(q: np.ndarray) -> np.ndarray:
+	"""(..., 4) w-first quaternions to (..., 3, 3) rotation matrices."""
+	q = q / np.linalg.norm(q, axis=-1, keepdims=True)
+	w, x, y, z = np.moveaxis(q, -1, 0)
+	return np.stack((
+		np.stack((1 - 2*(y*y + z*z), 2*(x*y - w*z), 2*(x*z + w*y)), axis=-1)
+		,np.stack((2*(x*y + w*z), 1 - 2*(x*x + z*z), 2*(y*z - w*x)), axis=-1)
+		,np.stack((2*(x*z - w*y), 2*(y*z + w*x), 1 - 2*(x*x + y*y)), axis=-1)
+	), axis=-2)
+
+def matrix_to_quat(m: np.ndarray) -> np.ndarray:
+	"""(..., 3, 3) rotation matrices to w-first quaternions with w >= 0."""
+	m00, m01, m02 = m[..., 0, 0], m[..., 0, 1], m[..., 0, 2]
+	m10, m11, m12 = m[..., 1, 0], m[..., 1, 1], m[..., 1, 2]
+	m20, m21, m22 = m[..., 2, 0], m[..., 2, 1], m[..., 2, 2]
+	# Solve for the largest of w, x, y and z first, so there is never a division by a small number.
+	traces = np.stack((1 + m00 + m11 + m22, 1 + m00 - m11 - m22, 1 - m00 + m11 - m22, 1 - m00 - m11 + m22), axis=-1)
+	roots = np.sqrt(np.maximum(traces, 1e-12)) * 2
+	rw, rx, ry, rz = np.moveaxis(roots, -1, 0)
+	candidates = np.stack((
+		np.stack((rw / 4, (m21 - m12) / rw, (m02 - m20) / rw, (m10 - m01) / rw), axis=-1)
+		,np.stack(((m21 - m12) / rx, rx / 4, (m01 + m10) / rx, (m02 + m20) / rx), axis=-1)
+		,np.stack(((m02 - m20) / ry, (m01 + m10) / ry, ry / 4, (m12 + m21) / ry), axis=-1)
+		,np.stack(((m10 - m01) / rz, (m02 + m20) / rz, (m12 + m21) / rz, rz / 4), axis=-1)
+	), axis=-2)
+	best = np.argmax(traces, axis=-1)[..., None, None]
+	q = np.take_along_axis(candidates, np.broadcast_to(best, best.shape[:-2] + (1, 4)), axis=-2)[..., 0, :]
+	q = q / np.linalg.norm(q, axis=-1, keepdims=True)
+	return np.where(q[..., :1] < 0, -q, q)
+
+def make_continuous(q: np.ndarray) -> np.ndarray:
+	"""Flip (N, 4) quaternions where needed, so neighbouring keys don't interpolate the long way around."""
+	q = q.copy()
+	for i in range(1, len(q)):
+		if np.dot(q[i-1], q[i]) < 0:
+			q[i] = -q[i]
+	return q
+
+def compose(loc: np.ndarray, quat: np.ndarray, scale: np.ndarray) -> np.ndarray:
+	"""(N, 3), (N, 4) and (N, 3) arrays to (N, 4, 4) matrices of translation @ rotation @ scale."""
+	m = np.zeros((len(loc), 4, 4), dtype=np.float64)
+	m[:, :3, :3] = quat_to_matrix(quat.astype(np.float64)) * scale[:, None, :]
+	m[:, :3, 3] = loc
+	m[:, 3, 3] = 1
+	return m
+
+def decompose(m: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+	"""(N, 4, 4) matrices to location, w-first rotation and scale.
+	A mirroring matrix gets a negative X scale, rather than a rotation that isn't one."""
+	loc = m[:, :3, 3]
+	basis = m[:, :3, :3].copy()
+	scale = np.linalg.norm(basis, axis=-2)
+	scale[np.linalg.det(basis) < 0, 0] *= -1
+	rot = basis / np.where(np.abs(scale) < 1e-12, 1e-12, scale)[:, None, :]
+	return loc, make_continuous(matrix_to_quat(rot)), scale
+
+def get_rest_pose(node: Dict) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+	"""Return the location, w-first rotation and scale of a node."""
+	if 'matrix' in node:
+		m = np.array(node['matrix'], dtype=np.float64).reshape(1, 4, 4).transpose(0, 2, 1)
+		loc, quat, scale = decompose(m)
+		return loc[0], quat[0], scale[0]
+	x, y, z, w = node.get('rotation', (0, 0, 0, 1))
+	return (
+		np.array(node.get('translation', (0, 0, 0)), dtype=np.float64)
+		,np.array((w, x, y, z), dtype=np.float64)
+		,np.array(node.get('scale', (1, 1, 1)), dtype=np.float64)
+	)
+
+def get_rest_matrix(node: Dict) -> np.ndarray:
+	loc, quat, scale = get_rest_pose(node)
+	return compose(loc[None], quat[None], scale[None])[0]
+
+def get_world_rest_matrices(nodes: List[Dict]) -> Dict[int, np.ndarray]:
+	"""Rest matrix of every node in the glTF scene's space."""
+	parents = {child : i for i, node in enumerate(nodes) for child in node.get('children', [])}
+	world: Dict[int, np.ndarray] = {}
+	def get_world(i: int) -> np.ndarray:
+		if i not in world:
+			local = get_rest_matrix(nodes[i])
+			world[i] = get_world(parents[i]) @ local if i in parents else local
+		return world[i]
+	for i in range(len(nodes)):
+		get_world(i)
+	return world
+
+def sample(times: np.ndarray, values: np.ndarray, interpolation: str, at: np.ndarray) -> np.ndarray:
+	"""Values of a channel at other times than its own keys."""
+	if len(times) == len(at) and np.array_equal(times, at):
+		return values
+	if interpolation == 'STEP':
+		return values[np.clip(np.searchsorted(times, at, side='right') - 1, 0, len(times) - 1)]
+	if values.shape[1] == 4:
+		values = make_continuous(values)
+	sampled = np.stack([np.interp(at, times, values[:, i]) for i in range(values.shape[1])], axis=-1)
+	if values.shape[1] == 4:
+		sampled /= np.linalg.norm(sampled, axis=-1, keepdims=True)
+	return sampled
+
+def read_bone_channels(filepath: str, bones: Dict[str, BoneRest], animation_index=0) -> List[BoneChannel]:
+	"""Read the animation of the joints of a glTF file, as pose bone values of the armature whose bones are given.
+
+	The bones don't have to be oriented like the glTF joints, which depends on how the armature was imported.
+	Each bone's rest orientation relative to its joint is a constant, so the animated local transform of a joint
+	is conjugated into the space of its bone:
+		basis = K @ local(t) @ local_rest^-1 @ K^-1, where K = bone_rest^-1 @ Y_UP_TO_Z_UP @ parent_joint_world_rest
+	This only holds if each bone's parent is the bone of its joint's parent, which the glTF importer keeps,
+	and if the armature is still where the glTF importer put it, since the bone rest matrices are in world space.
+	"""
+	gltf, buffers = load_gltf(filepath)
+	animations = gltf.get('animations', [])
+	if animation_index >= len(animations):
+		return []
+	animation = animations[animation_index]
+	nodes = gltf.get('nodes', [])
+	parents = {child : i for i, node in enumerate(nodes) for child in node.get('children', [])}
+
+	# Node index : {glTF path : (times, values, interpolation)}
+	node_channels: Dict[int, Dict[str, Tuple[np.ndarray, np.ndarray, str]]] = {}
+	for channel in animation['channels']:
+		target = channel['target']
+		node_index = target.get('node')
+		if node_index is None or target['path'] not in ('translation', 'rotation', 'scale'):
+			continue
+		sampler = animation['samplers'][channel['sampler']]
+		interpolation = sampler.get('interpolation', 'LINEAR')
+		times = read_accessor(gltf, buffers, sampler['input'])[:, 0].astype(np.float64)
+		values = read_accessor(gltf, buffers, sampler['output']).astype(np.float64)
+		if interpolation == 'CUBICSPLINE':
+			# Each key is stored as in-tangent, value, out-tangent. Only the values are kept.
+			values = values.reshape(len(times), 3, -1)[:, 1]
+			interpolation = 'LINEAR'
+		if target['path'] == 'rotation':
+			values = values[:, [3, 0, 1, 2]]
+		node_channels.setdefault(node_index, {})[target['path']] = (times, values, interpolation)
+
+	world_rest = get_world_rest_matrices(nodes)
+	channels = []
+	for node_index, paths in node_channels.items():
+		node = nodes[node_index]
+		name = node.get('name', f"node_{node_index}")
+		bone = bones.get(name)
+		if bone is None:
+			continue
+		parent_index = parents.get(node_index)
+		parent_name = nodes[parent_index].get('name', "") if parent_index is not None else ""
+		if bone.parent and bone.parent != parent_name:
+			print(f"Parent of bone {name} is {bone.parent}, but its joint's parent is {parent_name}, skipping it.")
+			continue
+
+		times = np.unique(np.concatenate([channel[0] for channel in paths.values()]))
+		rest_loc, rest_rot, rest_scale = get_rest_pose(node)
+		loc, rot, scale = [
+			sample(*paths[path], times) if path in paths else np.repeat(rest[None], len(times), axis=0)
+			for path, rest in (('translation', rest_loc), ('rotation', rest_rot), ('scale', rest_scale))
+		]
+		local = compose(loc, rot, scale)
+
+		parent_world = world_rest[parent_index] if parent_index is not None else np.identity(4)
+		k = np.linalg.inv(bone.matrix) @ Y_UP_TO_Z_UP @ parent_world
+		basis = k @ local @ np.linalg.inv(get_rest_matrix(node)) @ np.linalg.inv(k)
+
+		interpolations = {channel[2] for channel in paths.values()}
+		interpolation = interpolations.pop() if len(interpolations) == 1 else 'LINEAR'
+		for path, values in zip(('location', 'rotation_quaternion', 'scale'), decompose(basis)):
+			channels.append(BoneChannel(name, path, times.astype(np.float32), values.astype(np.float32), interpolation))
+	return channels
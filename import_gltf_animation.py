@@ -0,0 +1,84 @@
+from typing import List, Set, Dict, Optional
+from bpy.types import Action, Object
+
+import bpy, os, time
+import numpy as np
+from datetime import datetime
+
+from .gltf_reader import BoneChannel, BoneRest, read_bone_channels
+
+# keyframe_points.foreach_set() takes enum items by index.
+INTERPOLATION_INDEX = {
+	'STEP' : 0			# CONSTANT
+	,'LINEAR' : 1
+	,'CUBICSPLINE' : 1	# The tangents are dropped, and the keys are dense enough for LINEAR.
+}
+
+def get_action_name(filepath: str) -> str:
+	"""ACLViewer names its exports <Animation>out.gltf."""
+	filename = os.path.basename(filepath)
+	return filename.replace("out.gltf", "").replace(".gltf", "").replace(".glb", "")
+
+def build_action(name: str, channels: List[BoneChannel], fps: float) -> Action:
+	"""Create an action with an F-curve for each component of each channel, filling the keyframes in bulk."""
+	action = bpy.data.actions.new(name)
+	for channel in channels:
+		data_path = f'pose.bones["{channel.bone}"].{channel.path}'
+		frames = channel.times * fps + 1
+		key_count = len(frames)
+		interpolation = np.full(key_count, INTERPOLATION_INDEX.get(channel.interpolation, 1), dtype=np.int32)
+		for index in range(channel.values.shape[1]):
+			fcurve = action.fcurves.new(data_path, index=index, action_group=channel.bone)
+			fcurve.keyframe_points.add(key_count)
+			co = np.empty(key_count * 2, dtype=np.float32)
+			co[0::2] = frames
+			co[1::2] = channel.values[:, index]
+			fcurve.keyframe_points.foreach_set('co', co)
+			fcurve.keyframe_points.foreach_set('interpolation', interpolation)
+			fcurve.update()
+	return action
+
+def get_bone_rests(armature: Object) -> Dict[str, BoneRest]:
+	"""Rest matrices of the bones in world space, which is what the glTF joints are compared to."""
+	return {
+		bone.name : BoneRest(np.array(armature.matrix_world @ bone.matrix_local, dtype=np.float64), bone.parent.name if bone.parent else "")
+		for bone in armature.data.bones
+	}
+
+def import_animation(filepath: str, armature: Object, name="", fps: Optional[float] = None, bones: Optional[Dict[str, BoneRest]] = None) -> Optional[Action]:
+	"""Import the animation of a glTF file as an action for an armature, eg. the one imported from the character's glTF."""
+	name = name or get_action_name(filepath)
+	fps = fps or bpy.context.scene.render.fps / bpy.context.scene.render.fps_base
+	channels = read_bone_channels(filepath, bones or get_bone_rests(armature))
+	if not channels:
+		print("No bone animation in ", filepath)
+		return
+	action = build_action(name, channels, fps)
+	action.use_fake_user = True
+	return action
+
+def import_animations(folder: str, armature: Object, existing_names: Optional[Set[str]] = None) -> List[Action]:
+	"""Import every .gltf/.glb animation in a folder as an action for an armature, skipping ones that already exist."""
+	bones = get_bone_rests(armature)
+	if existing_names is None:
+		existing_names = set(bpy.data.actions.keys())
+	start = time.time()
+	actions = []
+	for subdir, dirs, files in os.walk(folder):
+		for file in files:
+			if not file.endswith((".gltf", ".glb")):
+				continue
+			name = get_action_name(file)
+			if name in existing_names:
+				continue
+			action = import_animation(os.path.join(subdir, file), armature, name, bones=bones)
+			if not action:
+				continue
+			existing_names.add(action.name)
+			actions.append(action)
+			now = datetime.now().strftime("%H:%M:%S")
+			print(f"{now} Imported animation: {action.name}")
+	print(f"Imported {len(actions)} animations in {time.time()-start:.1f}s")
+	return actions
+
+# import_animations("D:\\3D\\Kena\\Tools\\ACLAnimViewer_Kena\\Export\\SK_Kenaout", bpy.data.objects["Armature"])
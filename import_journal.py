@@ -0,0 +1,99 @@
+# Append-only record of the progress of a batch import, so a crashed import can be resumed.
+# Nothing in here may import bpy.
+
+from typing import Dict, Optional
+import os, json, time
+
+class ImportJournal:
+	"""Each line of the journal file is a JSON entry, either about a single imported file,
+	or a checkpoint, which means the .blend file was saved at that point.
+
+	Files recorded after the last checkpoint were never saved into the .blend,
+	so when the journal is loaded, only entries before the last checkpoint count as finished.
+	"""
+
+	def __init__(self, filepath: str):
+		self.filepath = filepath
+		self.finished: Dict[str, Dict] = {}	# Relative file path : entry, for entries covered by a checkpoint.
+		self.pending: Dict[str, Dict] = {}	# Entries since the last checkpoint.
+		self.load()
+
+	def load(self):
+		self.finished.clear()
+		self.pending.clear()
+		if not os.path.isfile(self.filepath):
+			return
+
+		with open(self.filepath) as f:
+			lines = f.readlines()
+		saved_line_count = 0
+		for i, line in enumerate(lines):
+			try:
+				entry = json.loads(line)
+			except ValueError:
+				# The last line may be cut off if we crashed while writing it.
+				continue
+			if entry['status'] == 'checkpoint':
+				self.finished.update(self.pending)
+				self.pending.clear()
+				saved_line_count = i + 1
+			else:
+				self.pending[entry['file']] = entry
+
+		# These were never saved, so they will have to be imported again.
+		self.pending.clear()
+		if saved_line_count < len(lines):
+			# Drop them from the file too, otherwise the next checkpoint would count them as saved.
+			tmp_path = self.filepath + ".tmp"
+			with open(tmp_path, 'w') as f:
+				f.writelines(lines[:saved_line_count])
+			os.replace(tmp_path, self.filepath)
+
+	def is_finished(self, file: str, retry_failed=False) -> bool:
+		entry = self.finished.get(file)
+		if not entry:
+			return False
+		if retry_failed and entry['status'] == 'failed':
+			return False
+		return True
+
+	def record(self, file: str, status: str, *, seconds=0.0, size=0, error: Optional[str]=None):
+		"""Record the result of a single file. status is 'done', 'skipped' or 'failed'."""
+		entry = {
+			'file' : file
+			,'status' : status
+			,'seconds' : round(seconds, 3)
+			,'bytes' : size
+			,'time' : time.time()
+		}
+		if error:
+			entry['error'] = error
+		self.write(entry)
+		self.pending[file] = entry
+
+	def checkpoint(self):
+		"""Should be called right after the .blend file was saved."""
+		self.write({'status' : 'checkpoint', 'time' : time.time()})
+		self.finished.update(self.pending)
+		self.pending.clear()
+
+	def write(self, entry: Dict):
+		with open(self.filepath, 'a') as f:
+			f.write(json.dumps(entry) + "\n")
+			f.flush()
+			os.fsync(f.fileno())
+
+def read_journal_entries(filepath: str):
+	"""Return all file entries of a journal, including the ones not covered by a checkpoint."""
+	if not os.path.isfile(filepath):
+		return []
+	entries = []
+	with open(filepath) as f:
+		for line in f:
+			try:
+				entry = json.loads(line)
+			except ValueError:
+				continue
+			if entry['status'] != 'checkpoint':
+				entries.append(entry)
+	return entries
@@ -0,0 +1,257 @@
+# Dry run of a batch import: work out what would be imported and roughly how long it would take,
+# without Blender. Nothing in here may import bpy.
+#
+# Usage, from outside of Blender:
+#   python import_plan.py <extract_path> [--catalogs blender_assets.cats.txt] [--name-chain Characters/Kena]
+#       [--profile earlier_run.import_profile.jsonl] [--workers 8] [--json plan.json]
+
+from typing import List, Dict, Tuple, Optional
+import os, sys, json, argparse, struct
+
+try:
+	from .extract_files import (
+		is_psk, folder_path_to_catalog_name_chain, find_psk_files_to_import, build_material_map
+	)
+	from .asset_catalogs import AssetCatalog, AssetCatalogs, NameChainFilter, name_chain_to_catalog
+	from .props_txt_to_json import props_txt_to_dict, mat_info_to_params
+	from .psk_reader import read_chunk_headers, read_material_names
+	from .import_profiler import estimate_seconds_per_byte
+except ImportError:
+	# Running as a script.
+	from extract_files import (
+		is_psk, folder_path_to_catalog_name_chain, find_psk_files_to_import, build_material_map
+	)
+	from asset_catalogs import AssetCatalog, AssetCatalogs, NameChainFilter, name_chain_to_catalog
+	from props_txt_to_json import props_txt_to_dict, mat_info_to_params
+	from psk_reader import read_chunk_headers, read_material_names
+	from import_profiler import estimate_seconds_per_byte
+
+# Rough number of bytes Blender needs per element of an imported mesh, for the memory estimate.
+BYTES_PER_VERTEX = 64
+BYTES_PER_WEDGE = 48
+BYTES_PER_FACE = 96
+
+def folder_jobs(extract_path: str, name_chains: List[List[str]]=[]) -> List[Tuple[str, AssetCatalog]]:
+	"""When there is no catalog file yet, treat every folder as a catalog."""
+	extract_path = os.path.abspath(extract_path)
+	name_filter = NameChainFilter(name_chains)
+	jobs = []
+	for subdir, dirs, files in os.walk(extract_path):
+		name_chain = folder_path_to_catalog_name_chain(subdir.replace(extract_path, ""))
+		if not name_chain:
+			continue
+		if not name_filter.matches(name_chain):
+			dirs.clear()
+			continue
+		cat = name_chain_to_catalog(name_chain)
+		for filename in files:
+			if is_psk(filename):
+				jobs.append((os.path.join(subdir, filename), cat))
+	return jobs
+
+def read_tga_size(filepath: str) -> Tuple[int, int, int]:
+	"""Return width, height and bits per pixel from the header of a .tga file."""
+	with open(filepath, 'rb') as f:
+		header = f.read(18)
+	if len(header) < 18:
+		return 0, 0, 0
+	width, height, bpp = struct.unpack("<HHB", header[12:17])
+	return width, height, bpp
+
+def get_parent_path(mat_info: Dict) -> Optional[str]:
+	if 'Parent' not in mat_info:
+		return None
+	return mat_info['Parent'].split("'")[1].split(".")[0]
+
+class MaterialResolver:
+	"""Follows material parent chains through .props.txt files, parsing each file only once."""
+
+	def __init__(self, extract_path: str, mat_map: Dict[str, str]):
+		self.extract_path = extract_path
+		self.mat_map = mat_map
+		self.infos: Dict[str, Dict] = {}
+
+	def read(self, props_path: str) -> Dict:
+		if props_path not in self.infos:
+			try:
+				self.infos[props_path] = props_txt_to_dict(props_path)
+			except Exception as e:
+				print(f"Failed to parse {props_path}: {e}")
+				self.infos[props_path] = {}
+		return self.infos[props_path]
+
+	def walk(self, mat_name: str) -> List[Tuple[str, Dict]]:
+		"""Return the .props.txt path and contents of a material and each of its parents."""
+		props_path = self.mat_map.get(mat_name)
+		chain = []
+		seen = set()
+		while props_path and os.path.isfile(props_path) and props_path not in seen:
+			seen.add(props_path)
+			mat_info = self.read(props_path)
+			chain.append((props_path, mat_info))
+
+			parent_path = get_parent_path(mat_info)
+			if not parent_path:
+				break
+			props_path = self.extract_path + os.sep + parent_path + ".props.txt"
+		return chain
+
+	def resolve(self, mat_name: str) -> Tuple[List[str], List[str]]:
+		"""Return the chain of parent material names and all texture paths of a material."""
+		chain = self.walk(mat_name)
+		parents = []
+		textures = []
+		for props_path, mat_info in chain:
+			parent_path = get_parent_path(mat_info)
+			if parent_path:
+				parents.append(parent_path.split("/")[-1])
+			tex_params = mat_info_to_params(mat_info)[0]
+			textures.extend(value for value in tex_params.values() if value)
+		return parents, textures
+
+def make_parent_lookup(extract_path: str, mat_map: Optional[Dict[str, str]] = None):
+	"""Return a function that maps a material name to the root of its parent chain."""
+	resolver = MaterialResolver(extract_path, mat_map or build_material_map(extract_path))
+	cache = {}
+	def parent_of(mat_name: str) -> Optional[str]:
+		if mat_name not in cache:
+			parents = resolver.resolve(mat_name)[0]
+			cache[mat_name] = parents[-1] if parents else None
+		return cache[mat_name]
+	return parent_of
+
+def plan_import(
+		extract_path: str
+		,catalog_filepath: str = ""
+		,name_chains: List[List[str]] = []
+		,profile_reports: List[str] = []
+		,workers = 1
+	) -> Dict:
+	extract_path = os.path.abspath(extract_path)
+	if catalog_filepath:
+		jobs = find_psk_files_to_import(extract_path, AssetCatalogs.from_file(catalog_filepath), name_chains)
+	else:
+		jobs = folder_jobs(extract_path, name_chains)
+
+	mat_map = build_material_map(extract_path)
+	resolver = MaterialResolver(extract_path, mat_map)
+	fixed_seconds, seconds_per_byte = estimate_seconds_per_byte(profile_reports)
+
+	catalogs = {}
+	materials = {}		# Material name : number of files using it
+	missing_materials = set()
+	mesh_bytes = 0
+	files = []
+	for filepath, cat in jobs:
+		size = os.path.getsize(filepath)
+		cat_path = cat.path
+		cat = catalogs.setdefault(cat_path, {'files' : 0, 'bytes' : 0})
+		cat['files'] += 1
+		cat['bytes'] += size
+
+		chunks = read_chunk_headers(filepath)
+		for name, per_element in (("PNTS0000", BYTES_PER_VERTEX), ("VTXW0000", BYTES_PER_WEDGE), ("FACE0000", BYTES_PER_FACE), ("FACE3200", BYTES_PER_FACE)):
+			if name in chunks:
+				mesh_bytes += chunks[name].data_count * per_element
+
+		mat_names = read_material_names(filepath)
+		for mat_name in mat_names:
+			materials[mat_name] = materials.get(mat_name, 0) + 1
+			if mat_name not in mat_map:
+				missing_materials.add(mat_name)
+
+		files.append({
+			'file' : os.path.relpath(filepath, extract_path)
+			,'catalog' : cat_path
+			,'bytes' : size
+			,'materials' : mat_names
+			,'estimated_seconds' : fixed_seconds + seconds_per_byte * size
+		})
+
+	parent_fan_in = {}	# Parent material name : number of materials that inherit from it
+	textures = set()
+	for mat_name in materials:
+		parents, tex_paths = resolver.resolve(mat_name)
+		for parent in set(parents):
+			parent_fan_in[parent] = parent_fan_in.get(parent, 0) + 1
+		textures.update(tex_paths)
+
+	texture_bytes = 0
+	texture_decoded_bytes = 0
+	missing_textures = []
+	for tex_path in textures:
+		abs_path = extract_path + os.sep + tex_path
+		if not os.path.isfile(abs_path):
+			missing_textures.append(tex_path)
+			continue
+		texture_bytes += os.path.getsize(abs_path)
+		width, height, bpp = read_tga_size(abs_path)
+		# Blender keeps images in memory as 8 bit RGBA.
+		texture_decoded_bytes += width * height * 4
+
+	total_bytes = sum(f['bytes'] for f in files)
+	total_seconds = sum(f['estimated_seconds'] for f in files)
+	longest_file = max((f['estimated_seconds'] for f in files), default=0.0)
+
+	return {
+		'extract_path' : extract_path
+		,'files' : files
+		,'catalogs' : catalogs
+		,'total_files' : len(files)
+		,'total_bytes' : total_bytes
+		,'materials' : materials
+		,'missing_materials' : sorted(missing_materials)
+		,'parent_fan_in' : parent_fan_in
+		,'textures' : sorted(textures)
+		,'missing_textures' : sorted(missing_textures)
+		,'texture_bytes' : texture_bytes
+		,'estimated_memory_bytes' : mesh_bytes + texture_decoded_bytes
+		,'seconds_per_byte' : seconds_per_byte
+		,'seconds_per_file' : fixed_seconds
+		,'estimated_seconds' : total_seconds
+		# A lower bound, assuming perfectly balanced workers.
+		,'estimated_seconds_parallel' : max(total_seconds / max(1, workers), longest_file)
+		,'workers' : workers
+	}
+
+def print_plan(plan: Dict, count=20):
+	print(f"Import plan for {plan['extract_path']}")
+	print(f"    Files: {plan['total_files']}, {plan['total_bytes']/1e6:.1f} MB")
+	print(f"    Materials: {len(plan['materials'])} ({len(plan['missing_materials'])} without .props.txt)")
+	print(f"    Textures: {len(plan['textures'])}, {plan['texture_bytes']/1e6:.1f} MB on disk ({len(plan['missing_textures'])} missing)")
+	print(f"    Estimated memory: {plan['estimated_memory_bytes']/1e9:.2f} GB")
+	if plan['seconds_per_byte'] or plan['seconds_per_file']:
+		print(f"    Estimated time: {plan['estimated_seconds']/3600:.1f} hours, "
+			f"at least {plan['estimated_seconds_parallel']/3600:.1f} hours with {plan['workers']} workers")
+	else:
+		print("    No profile reports of earlier runs were given, so there is no time estimate.")
+
+	print(f"\nLargest {count} catalogs:")
+	print(f"{'Files':>7} {'MB':>9}  Catalog")
+	for cat_path, cat in sorted(plan['catalogs'].items(), key=lambda kv: kv[1]['bytes'], reverse=True)[:count]:
+		print(f"{cat['files']:>7} {cat['bytes']/1e6:>9.1f}  {cat_path}")
+
+	print(f"\nMost used parent materials:")
+	print(f"{'Children':>9}  Parent")
+	for parent, fan_in in sorted(plan['parent_fan_in'].items(), key=lambda kv: kv[1], reverse=True)[:count]:
+		print(f"{fan_in:>9}  {parent}")
+
+def main(argv: List[str]):
+	parser = argparse.ArgumentParser(description="Plan a batch import of a umodel extract folder, without Blender.")
+	parser.add_argument('extract_path')
+	parser.add_argument('--catalogs', default="", help="Catalog file to use. Without it, every folder is treated as a catalog")
+	parser.add_argument('--name-chain', action='append', default=[], help="Only plan this catalog path, eg. Characters/Kena. Can be repeated")
+	parser.add_argument('--profile', action='append', default=[], help="Profile report of an earlier run, for the time estimate. Can be repeated")
+	parser.add_argument('--workers', type=int, default=1)
+	parser.add_argument('--json', default="", help="Write the full plan to this file")
+	args = parser.parse_args(argv)
+
+	name_chains = [chain.split("/") for chain in args.name_chain]
+	plan = plan_import(args.extract_path, args.catalogs, name_chains, args.profile, args.workers)
+	print_plan(plan)
+	if args.json:
+		with open(args.json, 'w') as f:
+			json.dump(plan, f, indent=4)
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
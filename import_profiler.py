@@ -0,0 +1,144 @@
+# Timing and memory instrumentation of the import pipeline.
+# Nothing in here may import bpy, so reports can also be read outside of Blender.
+
+from typing import List, Dict, Tuple, Optional
+from contextlib import contextmanager
+import os, json, time, tracemalloc
+
+class ImportProfiler:
+	"""Records the wall time of each pipeline stage for each imported file,
+	and writes one JSON line per file to report_path.
+
+	Stage times are inclusive, eg. the time of generate_asset is also part of set_up_asset.
+	With trace_memory, the peak of Python allocations during each file is recorded as well.
+	That doesn't include memory allocated by Blender itself, but it does catch our own leaks.
+	"""
+
+	def __init__(self, report_path: str, trace_memory=False):
+		self.report_path = report_path
+		self.trace_memory = trace_memory
+		self.record: Optional[Dict] = None
+		self.records: List[Dict] = []
+		self.stage_totals: Dict[str, List[float]] = {}	# Stage name : [seconds of each call]
+		self.start_time = time.time()
+		if trace_memory and not tracemalloc.is_tracing():
+			tracemalloc.start()
+
+	def begin_file(self, filepath: str):
+		self.record = {
+			'file' : filepath
+			,'bytes' : os.path.getsize(filepath) if os.path.isfile(filepath) else 0
+			,'stages' : {}
+		}
+		self.file_start = time.perf_counter()
+		if self.trace_memory:
+			tracemalloc.reset_peak()
+
+	def end_file(self, status='done', objects=0, vertices=0):
+		record = self.record
+		if not record:
+			return
+		record['status'] = status
+		record['seconds'] = round(time.perf_counter() - self.file_start, 4)
+		record['objects'] = objects
+		record['vertices'] = vertices
+		if self.trace_memory:
+			record['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+
+		with open(self.report_path, 'a') as f:
+			f.write(json.dumps(record) + "\n")
+		self.records.append(record)
+		self.record = None
+
+	def add_stage_time(self, name: str, seconds: float):
+		self.stage_totals.setdefault(name, []).append(seconds)
+		if self.record is not None:
+			stages = self.record['stages']
+			stages[name] = round(stages.get(name, 0.0) + seconds, 4)
+
+	def print_summary(self, count=10):
+		print_summary(self.records, self.stage_totals, time.time() - self.start_time, count)
+
+	def stop(self):
+		if self.trace_memory:
+			tracemalloc.stop()
+
+def print_summary(records: List[Dict], stage_totals: Dict[str, List[float]], total_seconds: float, count=10):
+	print(f"\nImported {len(records)} files in {total_seconds/60:.1f} minutes.")
+
+	print(f"\nSlowest {count} files:")
+	print(f"{'Seconds':>10} {'MB':>8} {'Verts':>9}  File")
+	for r in sorted(records, key=lambda r: r['seconds'], reverse=True)[:count]:
+		print(f"{r['seconds']:>10.2f} {r['bytes']/1e6:>8.2f} {r['vertices']:>9}  {r['file']}")
+
+	print("\nStages:")
+	print(f"{'Total s':>10} {'Calls':>7} {'Mean s':>8} {'Max s':>8}  Stage")
+	for name, times in sorted(stage_totals.items(), key=lambda kv: sum(kv[1]), reverse=True):
+		print(f"{sum(times):>10.1f} {len(times):>7} {sum(times)/len(times):>8.3f} {max(times):>8.3f}  {name}")
+
+def read_report(report_path: str) -> List[Dict]:
+	if not os.path.isfile(report_path):
+		return []
+	with open(report_path) as f:
+		return [json.loads(line) for line in f if line.strip()]
+
+def summarize_report(report_path: str, count=10):
+	"""Print the summary of an earlier run from its report file."""
+	records = read_report(report_path)
+	stage_totals = {}
+	for r in records:
+		for name, seconds in r['stages'].items():
+			stage_totals.setdefault(name, []).append(seconds)
+	print_summary(records, stage_totals, sum(r['seconds'] for r in records), count)
+
+def estimate_seconds_per_byte(report_paths: List[str]) -> Tuple[float, float]:
+	"""Fit seconds = fixed + per_byte * bytes over the files of earlier profiled runs."""
+	records = []
+	for path in report_paths:
+		records.extend(r for r in read_report(path) if r.get('status') == 'done')
+	if len(records) < 2:
+		return 0.0, 0.0
+
+	sizes = [r['bytes'] for r in records]
+	times = [r['seconds'] for r in records]
+	mean_size = sum(sizes) / len(sizes)
+	mean_time = sum(times) / len(times)
+	variance = sum((s - mean_size)**2 for s in sizes)
+	if variance == 0:
+		return mean_time, 0.0
+	per_byte = sum((s - mean_size) * (t - mean_time) for s, t in zip(sizes, times)) / variance
+	per_byte = max(per_byte, 0.0)
+	fixed = max(mean_time - per_byte * mean_size, 0.0)
+	return fixed, per_byte
+
+_active_profiler: Optional[ImportProfiler] = None
+
+def start_profiling(report_path: str, trace_memory=False) -> ImportProfiler:
+	global _active_profiler
+	_active_profiler = ImportProfiler(report_path, trace_memory)
+	return _active_profiler
+
+def stop_profiling(show_summary=True):
+	global _active_profiler
+	if not _active_profiler:
+		return
+	if show_summary:
+		_active_profiler.print_summary()
+	_active_profiler.stop()
+	_active_profiler = None
+
+def get_profiler() -> Optional[ImportProfiler]:
+	return _active_profiler
+
+@contextmanager
+def profile_stage(name: str):
+	"""Time a stage of the pipeline, if profiling was started. Otherwise, do nothing."""
+	profiler = _active_profiler
+	if not profiler:
+		yield
+		return
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		profiler.add_stage_time(name, time.perf_counter() - start)
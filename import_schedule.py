@@ -0,0 +1,104 @@
+# Ordering and grouping of the files of a batch import.
+# Nothing in here may import bpy, so it can be used by the coordinator of headless workers.
+
+from typing import List, Dict, Tuple, Optional, Callable
+import os, heapq
+
+try:
+	from .psk_reader import read_material_names
+	from .import_profiler import estimate_seconds_per_byte
+except ImportError:
+	from psk_reader import read_material_names
+	from import_profiler import estimate_seconds_per_byte
+
+class CostModel:
+	"""Estimated seconds it takes to import a file, based on its size.
+	Without profile reports of earlier runs, the cost is simply the file size,
+	which is good enough for balancing, just not for telling the time.
+	"""
+
+	def __init__(self, fixed=0.0, per_byte=1.0):
+		self.fixed = fixed
+		self.per_byte = per_byte
+
+	@classmethod
+	def from_profile_reports(cls, report_paths: List[str]) -> 'CostModel':
+		fixed, per_byte = estimate_seconds_per_byte(report_paths)
+		if not fixed and not per_byte:
+			return cls()
+		return cls(fixed, per_byte)
+
+	def cost(self, filepath: str) -> float:
+		return self.fixed + self.per_byte * os.path.getsize(filepath)
+
+def material_locality_key(filepath: str, parent_of: Optional[Callable[[str], str]] = None) -> str:
+	"""Files with the same key use the same materials, so importing them one after another
+	means the material and texture data is already loaded.
+	parent_of can map a material name to its parent material, to group files more coarsely.
+	"""
+	mat_names = read_material_names(filepath)
+	if not mat_names:
+		return ""
+	if parent_of:
+		return parent_of(mat_names[0]) or mat_names[0]
+	return mat_names[0]
+
+def schedule_jobs(
+		jobs: List[Tuple]
+		,workers = 1
+		,cost_model: Optional[CostModel] = None
+		,parent_of: Optional[Callable[[str], str]] = None
+		,max_group_share = 0.25
+	) -> List[List[Tuple]]:
+	"""Distribute jobs, tuples whose first element is a .psk filepath, across workers.
+
+	Files are grouped by the materials they use, and groups are assigned to workers
+	longest-processing-time-first: the most expensive remaining group always goes to the
+	worker with the least work so far. Groups bigger than max_group_share of a worker's share
+	are split up, since a few big indivisible groups can't be balanced.
+	Within a worker, expensive groups come first and files of a group stay together,
+	so a run doesn't end with a handful of huge meshes after hours of tiny props.
+	"""
+	cost_model = cost_model or CostModel()
+	workers = max(1, workers)
+
+	costs = {}
+	groups: Dict[str, List[Tuple]] = {}
+	for job in jobs:
+		costs[job] = cost_model.cost(job[0])
+		groups.setdefault(material_locality_key(job[0], parent_of), []).append(job)
+
+	total_cost = sum(costs.values())
+	max_group_cost = total_cost / workers * max_group_share
+
+	# Units of work that are assigned to workers as a whole.
+	units = []
+	for key, group_jobs in groups.items():
+		group_cost = sum(costs[job] for job in group_jobs)
+		if group_cost > max_group_cost and len(group_jobs) > 1:
+			units.extend((costs[job], key, [job]) for job in group_jobs)
+		else:
+			units.append((group_cost, key, group_jobs))
+	units.sort(key=lambda unit: unit[0], reverse=True)
+
+	bins = [[] for i in range(workers)]
+	loads = [(0.0, i) for i in range(workers)]
+	heapq.heapify(loads)
+	for cost, key, unit_jobs in units:
+		load, i = heapq.heappop(loads)
+		bins[i].extend((key, job) for job in unit_jobs)
+		heapq.heappush(loads, (load + cost, i))
+
+	schedule = []
+	for bin_jobs in bins:
+		key_costs = {}
+		for key, job in bin_jobs:
+			key_costs[key] = key_costs.get(key, 0.0) + costs[job]
+		bin_jobs.sort(key=lambda kj: (-key_costs[kj[0]], kj[0], -costs[kj[1]]))
+		schedule.append([job for key, job in bin_jobs])
+
+	return [s for s in schedule if s] or [[]]
+
+def order_jobs(jobs: List[Tuple], cost_model: Optional[CostModel] = None) -> List[Tuple]:
+	"""Order jobs for a single process."""
+	return schedule_jobs(jobs, 1, cost_model)[0]
@@ -1,13 +1,20 @@
 from typing import List, Dict, Tuple
 from bpy.types import Object, Material, Node, Image
-import bpy, os, sys, shutil
-from .props_txt_to_json import props_txt_to_dict
+import bpy, os, sys
+from bpy.app.handlers import persistent
 from .utils import get_extract_path
+from .extract_files import get_material_map
+from .texture_store import get_texture_store, save_texture_stores
+from .source_tracking import save_hash_caches
+from .texture_proxies import apply_texture_resolution, get_texture_resolution, get_full_res_path
 
 RES_FILE = "kena_materials.blend"
 RES_DIR = os.path.dirname(os.path.realpath(__file__))
 RES_PATH = os.path.join(RES_DIR, RES_FILE)
 
+# Path of the texture an image was copied from, relative to the extract folder.
+SOURCE_PATH_PROP = "source_path"
+
 EQUIVALENT_PARAMS = {
 	'BaseColor' : 'Diffuse'
 	,'Albedo' : 'Diffuse'
@@ -73,26 +80,6 @@ def ensure_node_group(ng_name):
 
 	return ng
 
-def build_material_map(path_to_files: str) -> Dict[str, str]:
-	"""
-	The meshes imported by the .psk importer have materials named according to the
-	material files (.props.txt) that were extracted by umodel.
-	To match the material to the correct file quicker, we build a mapping from
-	material name to filepath in one go.
-	"""
-
-	# NOTE: This currently catches .props.txt files that are for meshes, not materials, 
-	# but it shouldn't cause any problems because there shouldn't be a name overlap...
-
-	mat_map = {}
-
-	for subdir, dirs, files in os.walk(path_to_files):
-		mat_files = [f for f in files if f.endswith('.props.txt')]
-		for mat_file in mat_files:
-			mat_map[mat_file.replace(".props.txt", "")] = subdir + os.sep + mat_file
-
-	return mat_map
-
 def set_up_materials(context, obj: Object, mat_map: Dict[str, str]):
 	"""Set up all materials of the object."""
 
@@ -104,6 +91,7 @@ def set_up_materials(context, obj: Object, mat_map: Dict[str, str]):
 		if not mat_file:
 			continue
 
+		from .props_txt_to_json import props_txt_to_dict
 		mat_info = props_txt_to_dict(mat_file)
 
 		set_up_material(obj, mat, mat_info)
@@ -166,7 +154,7 @@ def set_up_material(obj: Object, mat: Material, mat_info: Dict):
 		if not input_pin:
 			continue
 			
-		if par_node.type == 'TEX_IMAGE' and par_node.image.name in TEX_BLACKLIST:
+		if par_node.type == 'TEX_IMAGE' and get_texture_name(par_node, tex_params) in TEX_BLACKLIST:
 			continue
 
 		if len(input_pin.links) > 0:
@@ -176,7 +164,7 @@ def set_up_material(obj: Object, mat: Material, mat_info: Dict):
 
 		links.new(par_node.outputs[0], input_pin)
 		
-		if par_node.type == 'TEX_IMAGE' and par_node.image and par_node.image.name.endswith("_D_A"):
+		if par_node.type == 'TEX_IMAGE' and par_node.image and get_texture_name(par_node, tex_params).endswith("_D_A"):
 			links.new(par_node.outputs[1], node_ng.inputs.get("Alpha"))
 
 		if par_node.type == 'TEX_IMAGE' and input_pin.name not in ['Diffuse', 'Alpha', 'IrisColor']:
@@ -197,6 +185,14 @@ def set_up_material(obj: Object, mat: Material, mat_info: Dict):
 	if 'EyeShadow' in mat.name:
 		mat.blend_method = 'BLEND'
 
+def get_texture_name(node: Node, tex_params: Dict) -> str:
+	"""Name of the texture the material asked for. Not necessarily the name of the image,
+	since identical textures share a single image."""
+	tex_path = tex_params.get(node.name)
+	if not tex_path:
+		return node.image.name if node.image else ""
+	return os.path.basename(tex_path).split(".")[0]
+
 def create_node_float(mat, par_name, par_value, node_ng):
 	nodes = mat.node_tree.nodes
 
@@ -280,14 +276,27 @@ def load_texture(
 
 	localize_image(img)
 
+	# If the texture is identical to one that's already loaded, use that image instead.
+	for i in bpy.data.images:
+		if i != img and get_full_res_path(i) == img.filepath:
+			bpy.data.images.remove(img)
+			return i
+
 	# Correct the image name.
 	filepath = img.filepath.replace(os.sep, "/")	# important to make separators consistent...
 	filename = filepath.split("/")[-1]
 	file_parts = filename.split(".")
 	img.name = file_parts[0]
 
+	apply_texture_resolution(img, get_texture_resolution())
+
 	return img
 
+def get_textures_dir() -> str:
+	"""Textures are copied to a folder called textures_ue next to the blend file,
+	to differentiate it from the Blender-managed "textures" folder."""
+	return os.path.join(os.path.dirname(bpy.data.filepath), "textures_ue")
+
 def localize_image(img: Image):
 	if img.filepath.startswith("//textures"):
 		# Image is already local.
@@ -305,88 +314,46 @@ def localize_image(img: Image):
 		print("Image not found: " + img.filepath)
 		return
 
-	# Change the image filepath to be next to the blend file to a folder called
-	# textures_ue, to differentiate it from the Blender-managed "textures" folder.
+	# Copy the image from the uncook folder next to the .blend file, keeping the folder structure,
+	# unless a file with the same contents was already copied, in which case that one is used.
 	img_abspath = os.path.abspath(img.filepath)
 	extract_path = os.path.abspath(get_extract_path(bpy.context))
-	blendfile_folder_path = os.path.dirname(bpy.data.filepath)
-	textures_abspath = os.path.join(blendfile_folder_path, "textures_ue")
-	new_abspath = img_abspath.replace(extract_path, textures_abspath)
-	new_rel_path = "//textures_ue" + img.filepath.replace(extract_path, "")
-
-	# Copy the image from the uncook folder next to the .blend file, 
-	os.makedirs(os.path.dirname(new_abspath), exist_ok=True)
-	shutil.copyfile(img.filepath, new_abspath)
-	img.filepath = new_rel_path
-
-def mat_info_to_params(mat_info):
-	tex_pars = mat_info.get('TextureParameterValues') or mat_info.get('CollectedTextureParameters')
-	vec_pars = mat_info.get('VectorParameterValues') or mat_info.get('CollectedVectorParameters')
-	scal_pars = mat_info.get('ScalarParameterValues') or mat_info.get('CollectedScalarParameters')
-
-	processed_tex = {}
-	processed_vec = {}
-	processed_scal = {}
-
-	if tex_pars:
-		for tex_param in tex_pars:
-			name = tex_param.get("Name") or tex_param.get("ParameterInfo").get("Name")
-			value = tex_param.get("Texture") or tex_param.get("ParameterValue")
-			if not value:
-				processed_tex[name] = None
-				continue
-			value = value.split("'")[1].split(".")[0] + ".tga"
-			processed_tex[name] = value
-
-	if vec_pars:
-		for vec_param in vec_pars:
-			name = vec_param.get("Name") or vec_param.get("ParameterInfo").get("Name")
-			value = vec_param.get("Value") or vec_param.get("ParameterValue")
-			value = [value['R'], value['G'], value['B'], value['A']]
-			processed_vec[name] = value
-
-	if scal_pars:
-		for scalar_param in scal_pars:
-			name = scalar_param.get("Name") or scalar_param.get("ParameterInfo").get("Name")
-			value = scalar_param.get("Value") or scalar_param.get("ParameterValue")
-			if not value:
-				continue
-			processed_scal[name] = value
-
-	# Sometimes master materials have a ReferencedTextures block within their CachedExpressionData block
-	# without having any CollectedTextureParameters.
-	# In this case the type of each texture is also not indicated, leaving us to guess by filename...
-	cached_exp_data = mat_info.get('CachedExpressionData')
-	if cached_exp_data:
-		tex_list = cached_exp_data.get('ReferencedTextures')
-		if tex_list:
-			for tex_path in tex_list:
-				value = tex_path.split("'")[1].split(".")[0] + ".tga"
-
-				name = ""
-				# Guess the texture type name
-				if value.endswith("_D.tga") or value.endswith("_D_A.tga") or 'diffuse' in value.lower():
-					name = 'Diffuse'
-				elif value.endswith("_H_R_AO.tga"):
-					name = 'H_R_AO'
-				elif value.endswith("_M_R_AO.tga"):
-					name = 'M_R_AO'
-				elif value.endswith("_AO_R_M.tga"):
-					name = 'AO_R_M'
-				elif value.endswith("_N.tga"):
-					name = 'Normal'
-				elif value.endswith("_E.tga"):
-					name = 'Emission'
-
-				if name=="" or name in processed_tex:
-					name = 'Unknown'
-
-				if name not in processed_tex:
-					processed_tex[name] = value
-
-	return processed_tex, processed_vec, processed_scal
+	rel_path = os.path.relpath(img_abspath, extract_path)
+	stored_path = get_texture_store(get_textures_dir()).add(img_abspath, rel_path)
+	img.filepath = "//textures_ue" + os.sep + stored_path
+	img[SOURCE_PATH_PROP] = rel_path
+
+def deduplicate_images() -> int:
+	"""Remap every local image to a single image per unique file contents,
+	eg. for files that were imported before the texture store existed."""
+	store = get_texture_store(get_textures_dir())
+	by_hash = {}
+	removed = 0
+	for img in list(bpy.data.images):
+		full_res_path = get_full_res_path(img)
+		if not full_res_path.startswith("//textures_ue") or img.library:
+			continue
+		abs_path = os.path.normpath(bpy.path.abspath(full_res_path))
+		if not os.path.isfile(abs_path):
+			continue
+		file_hash = store.get_hash(abs_path)
+		if file_hash not in by_hash:
+			by_hash[file_hash] = img
+			continue
+		img.user_remap(by_hash[file_hash])
+		bpy.data.images.remove(img)
+		removed += 1
+	store.save()
+	print(f"Removed {removed} duplicate images.")
+	return removed
+
+@persistent
+def save_caches_handler(dummy):
+	save_texture_stores()
+	save_hash_caches()
 
 def parse_mat_params(mat_name: str, mat_info: Dict) -> Tuple[Dict, Dict, Dict]:
+	from .props_txt_to_json import props_txt_to_dict, mat_info_to_params
 	tex_params = {}
 	vector_params = {}
 	scalar_params = {}
@@ -422,17 +389,23 @@ def parse_mat_params(mat_name: str, mat_info: Dict) -> Tuple[Dict, Dict, Dict]:
 
 	return tex_params, vector_params, scalar_params
 
-def load_materials_on_selected_objects(context):
-	extract_path = get_extract_path(context)
-	
-	mat_map = build_material_map(extract_path)
-	for key, value in mat_map.items():
-		full_path = os.path.join(extract_path, value)
-		mat_map[key] = full_path
-
+def load_materials_on_selected_objects(context, refresh=False):
+	"""Use refresh=True when the extract folder may have changed since the material map was cached."""
+	mat_map = get_material_map(get_extract_path(context), refresh)
 	for o in context.selected_objects:
 		set_up_materials(context, o, mat_map)
 
+class FILE_OT_deduplicate_kena_images(bpy.types.Operator):
+	"""Use a single image for each set of textures with identical contents"""
+	bl_idname = "file.deduplicate_kena_images"
+	bl_label = "Deduplicate Kena Images"
+	bl_options = {'REGISTER', 'UNDO'}
+
+	def execute(self, context):
+		count = deduplicate_images()
+		self.report({'INFO'}, f"Removed {count} duplicate images.")
+		return {'FINISHED'}
+
 class OBJECT_OT_SetUpMaterials(bpy.types.Operator):
 	"""Load UE4 materials on an object"""
 	bl_idname = "object.load_umodel_materials"
@@ -440,10 +413,19 @@ class OBJECT_OT_SetUpMaterials(bpy.types.Operator):
 	bl_options = {'REGISTER', 'UNDO'}
 
 	def execute(self, context):
-		load_materials_on_selected_objects(context)
+		# This is used after re-extracting, or adding .props.txt files, so don't trust the cached map.
+		load_materials_on_selected_objects(context, refresh=True)
 
 		return {'FINISHED'}
 	
 registry = [
 	OBJECT_OT_SetUpMaterials
-]
\ No newline at end of file
+	,FILE_OT_deduplicate_kena_images
+]
+
+def register():
+	# The store's index has to match the image paths saved in the .blend file.
+	bpy.app.handlers.save_post.append(save_caches_handler)
+
+def unregister():
+	bpy.app.handlers.save_post.remove(save_caches_handler)
\ No newline at end of file
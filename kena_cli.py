@@ -0,0 +1,146 @@
+# Run the import pipeline without the UI and without saved addon prefs, eg. on a build machine:
+#   blender -b --python-exit-code 1 --python kena_cli.py -- --extract-path /data/Extracted --output /data/Kena.blend
+# Stages run in the order of STAGES, and the output .blend is saved after each of them.
+# The .psk importer addon must be enabled in the Blender that runs this, for the import stage.
+# Asset previews are rendered by the thumbnail farm, since asset_generate_preview() needs a window, and only
+# queues a job that wouldn't finish before this script exits anyway.
+# With --library, the previews and compress stages have to be run on each library file separately, eg.:
+#   blender -b --python kena_cli.py -- --extract-path /data/Extracted --output /data/Kena_library/Characters.blend --stages previews,compress
+
+from typing import List
+import bpy, os, sys, argparse, importlib, addon_utils
+
+ADDON_DIR = os.path.dirname(os.path.realpath(__file__))
+ADDON_PACKAGE = os.path.basename(ADDON_DIR)
+STAGES = ['catalogs', 'materials', 'import', 'previews', 'compress']
+# Stages that work on the output file itself, so they'd have nothing to do with --library.
+OUTPUT_FILE_STAGES = ['previews', 'compress']
+MATERIAL_INDEX_FILENAME = "kena_material_index.json"
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+	parser = argparse.ArgumentParser(
+		prog="blender -b --python kena_cli.py --"
+		,description="Import extracted Kena files into an asset library .blend file."
+	)
+	parser.add_argument("--extract-path", required=True, help="Folder that umodel extracted the game files into")
+	parser.add_argument("--output", required=True, help=".blend file to import into. Created if it doesn't exist. The catalog file is written next to it")
+	parser.add_argument("--catalog", action='append', default=[], help="Only import this catalog and its sub-catalogs, eg. Characters/Kena. Can be given more than once")
+	parser.add_argument("--workers", type=int, default=1, help="Number of background Blender processes to import with. With 1, everything is imported in this process")
+	parser.add_argument("--library", action='store_true', help="With more than one worker, write one .blend per top-level catalog into a folder next to the output, instead of merging everything into it")
+	parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma separated stages to run, out of: {','.join(STAGES)}")
+	parser.add_argument("--retry-failed", action='store_true', help="Import files again that failed in an earlier run")
+	args = parser.parse_args(argv)
+
+	default_stages = args.stages == parser.get_default('stages')
+	args.stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+	unknown = [stage for stage in args.stages if stage not in STAGES]
+	if unknown:
+		parser.error(f"Unknown stages: {', '.join(unknown)}")
+	args.workers = max(1, args.workers)
+	if args.library and args.workers > 1:
+		# The assets end up in the library files, not in the output file.
+		if default_stages:
+			args.stages = [stage for stage in args.stages if stage not in OUTPUT_FILE_STAGES]
+			print(f"Skipping the {' and '.join(OUTPUT_FILE_STAGES)} stages, run them with each library file as the --output.")
+		elif set(args.stages) & set(OUTPUT_FILE_STAGES):
+			parser.error(f"--library can't be combined with the {' and '.join(OUTPUT_FILE_STAGES)} stages, "
+				"run those with each library file as the --output instead.")
+	return args
+
+def enable_addon():
+	"""Enable the addon from the folder this script is in, even if it isn't installed."""
+	parent_dir = os.path.dirname(ADDON_DIR)
+	if parent_dir not in sys.path:
+		sys.path.append(parent_dir)
+	assert addon_utils.enable(ADDON_PACKAGE, default_set=False), "Failed to enable the addon, see the errors above."
+
+def addon_module(name: str):
+	return importlib.import_module(ADDON_PACKAGE + "." + name)
+
+def open_output(blend_path: str):
+	blend_path = os.path.abspath(blend_path)
+	if os.path.isfile(blend_path):
+		if os.path.abspath(bpy.data.filepath) != blend_path:
+			bpy.ops.wm.open_mainfile(filepath=blend_path)
+		return
+	os.makedirs(os.path.dirname(blend_path), exist_ok=True)
+	bpy.ops.wm.read_homefile(use_empty=True)
+	bpy.ops.wm.save_as_mainfile(filepath=blend_path)
+
+def has_psk_importer() -> bool:
+	# Any attribute of bpy.ops.import_scene exists, only using it tells whether the operator is registered.
+	try:
+		bpy.ops.import_scene.psk.poll()
+		return True
+	except (AttributeError, KeyError, RuntimeError):
+		return False
+
+def count_failed_imports() -> int:
+	"""Files whose last journal entry says they failed to import."""
+	journal = addon_module('import_journal')
+	catalogs = addon_module('kena_generate_catalogs')
+	latest = {entry['file'] : entry for entry in journal.read_journal_entries(catalogs.get_journal_filepath())}
+	return sum(1 for entry in latest.values() if entry['status'] == 'failed')
+
+def run_import(context, args: argparse.Namespace) -> int:
+	"""Returns the number of files that failed to import."""
+	name_chains = [cat.strip("/").split("/") for cat in args.catalog if cat.strip("/")]
+	# The workers start from the same user prefs, so they have the importer if this process has it.
+	assert has_psk_importer(), "The .psk importer addon is not enabled."
+	if args.workers == 1:
+		addon_module('kena_generate_catalogs').import_folders(context, name_chains, retry_failed=args.retry_failed, previews=False)
+		return count_failed_imports()
+
+	shard_import = addon_module('shard_import')
+	output_base = os.path.splitext(bpy.data.filepath)[0]
+	if args.library:
+		failures = shard_import.import_library(context, output_base + "_library", name_chains, args.workers)
+	else:
+		failures = shard_import.import_sharded(context, output_base + "_shards", name_chains, args.workers, merge=True)
+	return sum(len(failed) for failed in failures.values())
+
+def generate_previews(context, args: argparse.Namespace):
+	bpy.ops.wm.save_mainfile()
+	count = addon_module('thumbnail_farm').render_thumbnails_farm(context, args.workers)
+	print(f"Loaded {count} thumbnails as asset previews.")
+
+def main(argv: List[str]) -> int:
+	args = parse_args(argv)
+	enable_addon()
+	utils = addon_module('utils')
+	extract_files = addon_module('extract_files')
+
+	# Background workers inherit this.
+	utils.set_extract_path(args.extract_path)
+	open_output(args.output)
+
+	context = bpy.context
+	failed = 0
+	for stage in STAGES:
+		if stage not in args.stages:
+			continue
+		print(f"=== Stage: {stage}")
+		if stage == 'catalogs':
+			addon_module('kena_generate_catalogs').generate_catalogs(context)
+		elif stage == 'materials':
+			# Only an index written by this run is used, one from an earlier run could be out of date.
+			index_path = os.path.join(os.path.dirname(bpy.data.filepath), MATERIAL_INDEX_FILENAME)
+			count = extract_files.save_material_map(utils.get_extract_path(context), index_path)
+			os.environ[extract_files.MATERIAL_INDEX_ENV] = index_path
+			print(f"Indexed {count} materials.")
+		elif stage == 'import':
+			failed = run_import(context, args)
+		elif stage == 'previews':
+			generate_previews(context, args)
+		elif stage == 'compress':
+			utils.compress_images()
+		bpy.ops.wm.save_mainfile()
+
+	if failed:
+		print(f"{failed} files failed to import.")
+		return 2
+	return 0
+
+if __name__ == "__main__":
+	argv = sys.argv[sys.argv.index("--")+1:] if "--" in sys.argv else []
+	sys.exit(main(argv))
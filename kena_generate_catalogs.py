@@ -1,88 +1,88 @@
-from typing import List, Dict
+from typing import List, Dict, Tuple, Set, Optional
 
 from bpy.types import Object, Collection, Operator
 from bpy.props import StringProperty
-import bpy, os
-from uuid import uuid4
-from .utils import get_extract_path, is_psk
-from .batch_import_psk import import_kena_psk
-
-ASSET_HEADER = """
-# This is an Asset Catalog Definition file for Blender.
-#
-# Empty lines and lines starting with `#` will be ignored.
-# The first non-ignored line should be the version indicator.
-# Other lines are of the format "UUID:catalog/path/for/assets:simple catalog name"
-
-VERSION 1
-
-"""
-ASSET_FILENAME = "blender_assets.cats.txt"
+import bpy, os, time, traceback
+from datetime import datetime
+from .utils import get_extract_path
+from .extract_files import (
+	folder_path_to_catalog_name_chain, find_folders_with_psk,
+	find_psk_files_to_import
+)
+from .asset_catalogs import (
+	ASSET_FILENAME, AssetCatalog, AssetCatalogs, name_chain_to_catalog
+)
+from .batch_import_psk import import_kena_psk, roll_back_failed_import, get_object_set, get_object_name_set
+from .import_journal import ImportJournal
+from .import_profiler import profile_stage, get_profiler, start_profiling, stop_profiling
+from .import_schedule import CostModel, order_jobs
+from .mesh_hash import get_mesh_index, get_skeleton_index
+from .source_tracking import SOURCE_PROP, get_source_tracker, sources_to_string
+
+# Save the .blend file during batch imports whenever this much source data was imported,
+# or this much time has passed since the last save.
+CHECKPOINT_BYTES = 256 * 1024 * 1024
+CHECKPOINT_SECONDS = 20 * 60
+
+# Names of assets whose preview still has to be generated.
+# Rendering previews is kept out of the import itself, see generate_queued_previews().
+PREVIEW_QUEUE: List[str] = []
+# asset_generate_preview() only starts a job that renders the preview later, so saving has to wait for it.
+PREVIEW_POLL_SECONDS = 2.0
+# Save anyway when no preview finished for this long, eg. for assets that can't get one.
+PREVIEW_STALL_SECONDS = 120.0
 
 def generate_catalogs(context):
 	"""Execute this funciton to generate the asset catalog .txt file based on
-	the extracted game's folder hierarchy. (only for folders that contain .fbx)"""
-	cats = folder_structure_to_catalogs(get_extract_path(context))
-	asset_filepath = os.path.join(os.path.dirname(bpy.data.filepath), ASSET_FILENAME)
-	asset_catalogue = ASSET_HEADER + "\n".join(cats)
+	the extracted game's folder hierarchy. (only for folders that contain .psk)
+	If the file already exists, only catalogs that aren't in it yet are added,
+	and existing catalogs keep their UUIDs, so assets that are already assigned to them stay valid."""
+	new_cats = folder_structure_to_catalogs(get_extract_path(context))
+	asset_filepath = get_catalog_filepath()
+
+	catalogs = AssetCatalogs()
+	if os.path.isfile(asset_filepath):
+		catalogs = AssetCatalogs.from_file(asset_filepath)
+	existing_count = len(catalogs)
+	for cat in new_cats:
+		catalogs.add(cat)
+	print(f"Catalogs: {existing_count} existing, {len(catalogs)-existing_count} added.")
+	if existing_count and len(catalogs) == existing_count:
+		return
 
-	f = open(asset_filepath, 'w')
-	f.write(asset_catalogue)
-	f.close()
+	catalogs.write(asset_filepath)
 
-def folder_structure_to_catalogs(root_dir: str) -> List[str]:
-	"""Generate the string of a catalog file, where each sub-folder of a directory is a catalog."""
+def folder_structure_to_catalogs(root_dir: str) -> List[AssetCatalog]:
+	"""Generate the catalogs of a catalog file, where each sub-folder of a directory is a catalog."""
 	root_dir = os.path.abspath(root_dir)
-	catalogs = {}	# simple-catalog-name : cat_def
-	for subdir, dirs, files in os.walk(root_dir):
-		if not has_psk_in_any_subfolder(subdir):
-			continue
-
+	catalogs = AssetCatalogs()
+	for subdir in find_folders_with_psk(root_dir):
 		catalog_path = subdir.replace(root_dir, "")[1:]
 		name_chain = folder_path_to_catalog_name_chain(catalog_path)
 
-		cat_def = name_chain_to_catalog_def(name_chain)
-		if not cat_def:
+		cat = name_chain_to_catalog(name_chain)
+		if not cat:
 			continue
 
 		# Avoid duplicates.
-		simple_name = cat_def.split(":")[2]
-		if simple_name not in catalogs:
-			catalogs[simple_name] = cat_def
+		catalogs.add(cat)
 
-	return list(catalogs.values())
+	return catalogs.catalogs
 
-def has_psk_in_any_subfolder(folder) -> bool:
-	for subdir, dirs, files in os.walk(folder):
-		for f in files:
-			if is_psk(f):
-				return True
-	return False
+def get_catalog_filepath() -> str:
+	return os.path.join(os.path.dirname(bpy.data.filepath), ASSET_FILENAME)
 
-def name_chain_to_catalog_def(name_chain: List[str]) -> str:
-	if not name_chain:
-		return
-	cat_def = f"{str(uuid4())}:{'/'.join(name_chain)}:{'-'.join(name_chain)}"
-	return cat_def
+def read_catalogs() -> AssetCatalogs:
+	"""Read and return the catalog definitions from the catalog .txt file."""
+	return AssetCatalogs.from_file(get_catalog_filepath())
 
-def folder_path_to_catalog_name_chain(folder_path: str):
-	folders = folder_path.split(os.sep)
-	return [f.replace("_", " ").title() for f in folders]
+def get_journal_filepath() -> str:
+	return os.path.splitext(bpy.data.filepath)[0] + ".import_journal.jsonl"
 
-def read_catalogs() -> List[str]:
-	"""Read and return the catalog definitions from the catalog .txt file."""
-	asset_filepath = os.path.join(os.path.dirname(bpy.data.filepath), ASSET_FILENAME)
-	contents = open(asset_filepath).read()
-	cats = contents.split("\n")[8:]
-	cats = [cat for cat in cats if cat] # Don't include empty lines.
-	return cats
-
-def get_catalog_of_folder(name_chain: List[str], cat_defs: List[str], subfolder: str):
-	for cat_def in cat_defs:
-		if "/".join(name_chain) == cat_def.split(":")[1]:
-			return cat_def
-
-def import_folders(context, name_chains: List[List[str]]=[]):
+def get_profile_report_filepath() -> str:
+	return os.path.splitext(bpy.data.filepath)[0] + ".import_profile.jsonl"
+
+def import_folders(context, name_chains: List[List[str]]=[], retry_failed=False, profile=True, trace_memory=False, previews=True):
 	"""Import a specific set of folders, or everything.
 	Also create assets.
 	w3_generate_catalogs.generate_catalogs() should be called first, to generate the asset catalog file.
@@ -90,62 +90,164 @@ def import_folders(context, name_chains: List[List[str]]=[]):
 	This function has no operator, it's to be called directly, eg., from a text editor.
 	Have a console open, since importing everything could take many hours, or even a day.
 	Memory requirement is not as bad as you'd think, but the import process will save the file pretty frequently.
+	Progress is written to a journal next to the .blend file, so if Blender crashes,
+	calling this again will continue from the last save.
+	With profile, the time spent in each stage of each file is written to a .jsonl report next to the .blend file,
+	and a summary of the slowest files and stages is printed at the end.
+	Asset previews are generated after everything was imported, and the file is saved again once they
+	were rendered, unless previews is False, in which case they can be generated later with generate_missing_previews().
 	"""
-	cat_defs = read_catalogs()
+	catalogs = read_catalogs()
 	extract_path = get_extract_path(context)
 
-	import_up_to_filesize(context, extract_path, cat_defs, name_chains)
-	bpy.ops.wm.save_mainfile()
+	if profile:
+		start_profiling(get_profile_report_filepath(), trace_memory)
+	try:
+		import_up_to_filesize(context, extract_path, catalogs, name_chains, retry_failed=retry_failed)
+	finally:
+		stop_profiling()
+	if not previews:
+		# Left for generate_missing_previews(), a later generate_queued_previews() mustn't pick them up.
+		PREVIEW_QUEUE.clear()
+	elif PREVIEW_QUEUE:
+		save_when_previews_done(generate_queued_previews())
 	print("Saved Blend file. Size: " + str(os.path.getsize(bpy.data.filepath)))
 
-def import_up_to_filesize(context, extract_path, cat_defs, name_chains=[]):
-	"""Import files from the extract path."""
+def import_up_to_filesize(context, extract_path, catalogs: AssetCatalogs, name_chains=[]
+		,checkpoint_bytes = CHECKPOINT_BYTES
+		,checkpoint_seconds = CHECKPOINT_SECONDS
+		,retry_failed = False
+	):
+	"""Import files from the extract path, saving the file every checkpoint_bytes of source data
+	or every checkpoint_seconds, whichever comes first."""
+	cat_to_coll = map_catalogs_to_collections(context, catalogs, extract_path)
+	jobs = find_psk_files_to_import(extract_path, catalogs, name_chains)
+	jobs = order_jobs(jobs, CostModel.from_profile_reports([get_profile_report_filepath()]))
+	journal = ImportJournal(get_journal_filepath())
+
+	import_jobs(context, jobs, extract_path, cat_to_coll, journal
+		,checkpoint_bytes = checkpoint_bytes
+		,checkpoint_seconds = checkpoint_seconds
+		,retry_failed = retry_failed
+	)
+
+def import_jobs(context
+		,jobs: List[Tuple[str, AssetCatalog]]
+		,extract_path: str
+		,cat_to_coll: Dict[str, Collection]
+		,journal: ImportJournal
+		,*
+		,checkpoint_bytes = CHECKPOINT_BYTES
+		,checkpoint_seconds = CHECKPOINT_SECONDS
+		,retry_failed = False
+	):
+	"""Import a list of (filepath, catalog) tuples, skipping the ones the journal
+	says were already finished. The file is saved at checkpoints and at the end."""
 	mem_bytes = 0
-	cat_to_coll = map_catalogs_to_collections(context, cat_defs, extract_path)
-
-	file_count = 0
-
-	for subdir, dirs, files in os.walk(extract_path):
-		# Find catalog definition for this subfolder...
-		catalog_path = subdir.replace(extract_path, "")
-		name_chain = folder_path_to_catalog_name_chain(catalog_path)
-		if not name_chain:
+	last_save = time.time()
+	skipped = 0
+	imported_names = get_object_name_set()
+	mesh_index = get_mesh_index()
+	skeleton_index = get_skeleton_index()
+
+	for filepath, cat in jobs:
+		path_from_uncook = os.path.relpath(filepath, extract_path)
+		if journal.is_finished(path_from_uncook, retry_failed):
+			skipped += 1
 			continue
-		if not is_good_name_chain(name_chain, name_chains):
-			continue
-		cat_def = get_catalog_of_folder(name_chain, cat_defs, subdir.replace(extract_path, ""))
-		if not cat_def:
+		if skipped:
+			print(f"Skipped {skipped} files that were already imported according to the journal.")
+			skipped = 0
+
+		file_size = os.path.getsize(filepath)
+		start = time.time()
+		profiler = get_profiler()
+		if profiler:
+			profiler.begin_file(filepath)
+		old_objects = get_object_set()
+		try:
+			objs = import_kena_asset(context, filepath, extract_path, cat, cat_to_coll[cat.uuid], imported_names, mesh_index, skeleton_index)
+		except Exception as e:
+			# Half-built objects would be saved at the next checkpoint, and keep the file from being retried.
+			roll_back_failed_import(context, old_objects, imported_names, mesh_index, skeleton_index)
+			traceback.print_exc()
+			journal.record(path_from_uncook, 'failed', seconds=time.time()-start, size=file_size, error=str(e))
+			if profiler:
+				profiler.end_file('failed')
 			continue
 
-		# Find collection of catalog...
-		coll = cat_to_coll[cat_def]
-
-		# Import the stuff.
-		for filename in files:
-			if not is_psk(filename):
-				continue
-			filepath = os.path.join(subdir, filename)
-			objs = import_kena_psk(context, filepath)
-			if not objs:
-				continue
-			file_count += 1
-			path_from_uncook = filepath.replace(extract_path, "")
-			mem_bytes += os.path.getsize(filepath)
-
-			bpy.ops.object.select_all(action='DESELECT')
-			for o in objs:
-				set_up_asset(context, o, coll, cat_def.split(":")[0], path_from_uncook)
-				o.hide_viewport=True
-
-def is_good_name_chain(name_chain: List[str], good_chains: List[List[str]]) -> bool:
-	for good_chain in good_chains:
-		match = True
-		for name1, name2 in zip(good_chain, name_chain):
-			if name1 != name2:
-				match = False
-		if match:
-			return True
-	return False
+		status = 'done' if objs else 'skipped'
+		journal.record(path_from_uncook, status, seconds=time.time()-start, size=file_size)
+		if profiler:
+			meshes = [o for o in objs if o.type == 'MESH']
+			profiler.end_file(status, len(objs), sum(len(o.data.vertices) for o in meshes))
+		mem_bytes += file_size
+
+		if mem_bytes >= checkpoint_bytes or time.time() - last_save >= checkpoint_seconds:
+			save_checkpoint(journal)
+			mem_bytes = 0
+			last_save = time.time()
+
+	save_checkpoint(journal)
+
+def save_checkpoint(journal: ImportJournal):
+	bpy.ops.wm.save_mainfile()
+	journal.checkpoint()
+	now = datetime.now().strftime("%H:%M:%S")
+	print(f"{now} Checkpoint saved: {len(journal.finished)} files finished.")
+
+def import_kena_asset(context
+		,filepath: str
+		,extract_path: str
+		,cat: AssetCatalog
+		,coll: Collection
+		,imported_names: Optional[Set[str]] = None
+		,mesh_index: Optional[Dict[str, str]] = None
+		,skeleton_index: Optional[Dict[str, str]] = None
+	) -> List[Object]:
+	"""Import a single .psk file and mark the resulting meshes as assets of a catalog."""
+	objs = import_kena_psk(context, filepath, imported_names=imported_names, mesh_index=mesh_index, skeleton_index=skeleton_index)
+	if not objs:
+		return objs
+
+	path_from_uncook = os.path.relpath(filepath, extract_path)
+	bpy.ops.object.select_all(action='DESELECT')
+	for o in objs:
+		with profile_stage("set_up_asset"):
+			set_up_asset(context, o, coll, cat.uuid, path_from_uncook)
+		with profile_stage("record_sources"):
+			record_sources(o, filepath, extract_path)
+		o.hide_viewport=True
+	return objs
+
+def record_sources(o: Object, filepath: str, extract_path: str):
+	"""Store which files an asset was made from, so asset_sync can tell when it's out of date."""
+	if o.type != 'MESH':
+		return
+	mat_names = [ms.material.name for ms in o.material_slots if ms.material]
+	sources = get_source_tracker(extract_path).get_sources(filepath, mat_names)
+	o[SOURCE_PROP] = sources_to_string(sources)
+
+def reload_kena_asset(context, ob: Object, extract_path: str) -> List[Object]:
+	"""Delete an asset and import it again from the .psk file in its description,
+	into the same catalog and collection."""
+	cat_id = ob.asset_data.catalog_id
+	coll = ob.users_collection[0]
+	description = ob.asset_data.description
+
+	if ob.parent and len(ob.parent.children) == 1:
+		bpy.data.objects.remove(ob.parent)
+	bpy.data.objects.remove(ob)
+
+	full_path = os.path.join(extract_path, description)
+	new_obs = import_kena_psk(context, full_path, do_clean_mesh=True)
+	for o in new_obs:
+		if not o.type=='MESH':
+			continue
+		set_up_asset(context, o, coll, cat_id, description)
+		record_sources(o, full_path, extract_path)
+		context.view_layer.objects.active = o
+	return new_obs
 
 def ensure_coll_hierarchy(coll, coll_names: List[str]) -> Collection:
 	"""Find a collection by a hierarchy, where the names don't have to be a perfect match."""
@@ -164,23 +266,31 @@ def ensure_coll_hierarchy(coll, coll_names: List[str]) -> Collection:
 	return ensure_coll_hierarchy(new_coll, coll_names[1:])
 
 def map_catalogs_to_collections(context
-		,cat_defs: List[str]
+		,catalogs: AssetCatalogs
 		,uncook_path: str
 	) -> Dict[str, Collection]:
-	"""Create a mapping from catalogs to existing collections."""
+	"""Create a mapping from catalog UUIDs to existing collections, creating the missing ones.
+	Each level of the hierarchy is only looked up once, no matter how many catalogs share it."""
+	path_to_coll = {"" : context.scene.collection}
 	cat_to_coll = {}
-	for cat_def in cat_defs:
-		if not cat_def:
-			continue
-		coll_names = get_name_hierarchy_of_cat(cat_def)
-		coll = ensure_coll_hierarchy(context.scene.collection, coll_names)
-		cat_to_coll[cat_def] = coll
+	for cat in catalogs:
+		cat_to_coll[cat.uuid] = ensure_coll_path(path_to_coll, cat.name_chain)
 
 	return cat_to_coll
 
-def get_name_hierarchy_of_cat(catalog_def: str) -> List[str]:
-	spl = catalog_def.split(":")
-	return spl[1].split("/")
+def ensure_coll_path(path_to_coll: Dict[str, Collection], coll_names: List[str]) -> Collection:
+	"""Like ensure_coll_hierarchy(), but remembering every collection it found by its path."""
+	path = "/".join(coll_names)
+	coll = path_to_coll.get(path)
+	if coll:
+		return coll
+
+	parent = ensure_coll_path(path_to_coll, coll_names[:-1])
+	coll = parent.children.get(coll_names[-1])
+	if not coll:
+		coll = ensure_coll_hierarchy(parent, coll_names[-1:])
+	path_to_coll[path] = coll
+	return coll
 
 def set_up_asset(context, o: Object, coll: Collection, cat_id: str, description: str):
 	if o.type != 'MESH':
@@ -218,10 +328,71 @@ def set_up_asset(context, o: Object, coll: Collection, cat_id: str, description:
 def generate_asset(o):
 	if o.asset_data:
 		return o.asset_data
-	o.asset_mark()
-	o.asset_generate_preview()
+	with profile_stage("generate_asset"):
+		o.asset_mark()
+	PREVIEW_QUEUE.append(o.name)
 	return o.asset_data
 
+def has_valid_preview(o: Object) -> bool:
+	# Don't use preview_ensure() here, that would create an empty preview.
+	return bool(o.preview and o.preview.image_size[0] > 0)
+
+def generate_previews(objects: List[Object]) -> List[str]:
+	"""Queue asset preview jobs, skipping objects that already have one. Blender renders them
+	after this returns, so the file has to be saved again once they're done, see save_when_previews_done().
+	Returns the names of the objects whose previews were queued."""
+	objects = [o for o in objects if o.asset_data and not has_valid_preview(o)]
+	with profile_stage("generate_previews"):
+		for o in objects:
+			o.asset_generate_preview()
+	now = datetime.now().strftime("%H:%M:%S")
+	print(f"{now} Queued {len(objects)} asset previews.")
+	return [o.name for o in objects]
+
+def generate_queued_previews() -> List[str]:
+	"""Generate the previews of the assets that were created since the last call."""
+	objects = [bpy.data.objects.get(name) for name in PREVIEW_QUEUE]
+	PREVIEW_QUEUE.clear()
+	return generate_previews([o for o in objects if o])
+
+def generate_missing_previews() -> List[str]:
+	"""Generate the previews of every asset in the file that doesn't have one yet.
+	Meant for a separate pass after an import that was done without previews."""
+	PREVIEW_QUEUE.clear()
+	return generate_previews([o for o in bpy.data.objects if o.asset_data])
+
+def save_when_previews_done(ob_names: List[str]):
+	"""Save the file from a timer, once the queued previews of these objects were rendered."""
+	progress = {'pending' : len(ob_names), 'time' : time.time()}
+
+	def check_previews():
+		pending = [name for name in ob_names
+			if name in bpy.data.objects and not has_valid_preview(bpy.data.objects[name])]
+		if len(pending) < progress['pending']:
+			progress['pending'] = len(pending)
+			progress['time'] = time.time()
+			now = datetime.now().strftime("%H:%M:%S")
+			print(f"{now} Previews left to render: {len(pending)}/{len(ob_names)}")
+		if pending and time.time() - progress['time'] < PREVIEW_STALL_SECONDS:
+			return PREVIEW_POLL_SECONDS
+		if pending:
+			print(f"Saving without the previews of {len(pending)} assets, generate them later with generate_missing_previews().")
+		bpy.ops.wm.save_mainfile()
+		print("Saved Blend file with previews.")
+		return None
+
+	bpy.app.timers.register(check_previews, first_interval=PREVIEW_POLL_SECONDS)
+
+class OBJECT_OT_generate_kena_previews(Operator):
+	"""Generate asset previews for every asset that doesn't have one yet"""
+	bl_idname = "object.generate_kena_previews"
+	bl_label = "Generate Missing Asset Previews"
+	bl_options = {'REGISTER', 'UNDO'}
+
+	def execute(self, context):
+		generate_missing_previews()
+		return {'FINISHED'}
+
 class OBJECT_OT_reload_kena_asset(Operator):
 	"""Re-import Kena asset"""
 	bl_idname = "object.reload_kena_asset"
@@ -239,26 +410,16 @@ class OBJECT_OT_reload_kena_asset(Operator):
 		bpy.ops.object.select_all(action='DESELECT')
 
 		ob = bpy.data.objects.get(self.ob_name)
-
-		cat_id = ob.asset_data.catalog_id
-		coll = ob.users_collection[0]
-		description = ob.asset_data.description
-
 		if not ob:
 			return {'CANCELLED'}
-		if ob.parent and len(ob.parent.children) == 1:
-			bpy.data.objects.remove(ob.parent)
-		bpy.data.objects.remove(ob)
 
-		full_path = os.path.join(get_extract_path(context), self.filepath)
-		new_obs = import_kena_psk(context, full_path, do_clean_mesh=True)
+		# The files may have changed since the material map was cached, which is why the asset is reloaded.
+		extract_path = get_extract_path(context)
+		get_source_tracker(extract_path, refresh=True)
+		new_obs = reload_kena_asset(context, ob, extract_path)
 		if not new_obs:
 			return {'FINISHED'}
-		for o in new_obs:
-			if not o.type=='MESH':
-				continue
-			set_up_asset(context, o, coll, cat_id, description)
-			context.view_layer.objects.active = o
+		generate_queued_previews()
 
 		return {'FINISHED'}
 
@@ -274,6 +435,7 @@ def context_menu_draw_kena(self, context):
 
 registry = [
 	OBJECT_OT_reload_kena_asset
+	,OBJECT_OT_generate_kena_previews
 ]
 
 def register():
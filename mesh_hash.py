@@ -0,0 +1,69 @@
+# Hashing of mesh and armature data, for recognizing identical meshes and skeletons
+# without comparing them element by element.
+
+from typing import Dict, Optional
+from bpy.types import Mesh, Armature, Object
+
+import bpy, re, hashlib
+
+GEOMETRY_HASH_PROP = "geometry_hash"
+SKELETON_HASH_PROP = "skeleton_hash"
+
+def hash_buffer(hasher, collection, attr: str, dtype: str, size=1):
+	import numpy as np
+	buf = np.empty(len(collection) * size, dtype=dtype)
+	collection.foreach_get(attr, buf)
+	hasher.update(attr.encode())
+	hasher.update(buf.tobytes())
+
+def hash_mesh(hasher, mesh: Mesh):
+	hash_buffer(hasher, mesh.vertices, 'co', 'float32', 3)
+	hash_buffer(hasher, mesh.loops, 'vertex_index', 'int32')
+	hash_buffer(hasher, mesh.polygons, 'loop_total', 'int32')
+	hash_buffer(hasher, mesh.polygons, 'material_index', 'int32')
+	hash_buffer(hasher, mesh.polygons, 'use_smooth', 'bool')
+	for uv_layer in mesh.uv_layers:
+		hash_buffer(hasher, uv_layer.data, 'uv', 'float32', 2)
+
+def strip_number_suffix(name: str) -> str:
+	"""Blender adds .001 to names that are taken, eg. when the same material is imported again."""
+	return re.sub(r"\.\d{3}$", "", name)
+
+def get_geometry_hash(mesh: Mesh) -> str:
+	"""Hash of the geometry, UVs and material names of a mesh, as it was imported."""
+	hasher = hashlib.sha1()
+	hash_mesh(hasher, mesh)
+	for mat in mesh.materials:
+		hasher.update(strip_number_suffix(mat.name if mat else "").encode())
+	return hasher.hexdigest()
+
+def get_mesh_index() -> Dict[str, str]:
+	"""Map the geometry hashes of already imported meshes to the mesh names.
+	When importing many files, build this once and pass it along, like the set of imported object names."""
+	return {m[GEOMETRY_HASH_PROP] : m.name for m in bpy.data.meshes if GEOMETRY_HASH_PROP in m}
+
+def find_duplicate_mesh(mesh_index: Dict[str, str], geometry_hash: str) -> Optional[Mesh]:
+	mesh = bpy.data.meshes.get(mesh_index.get(geometry_hash, ""))
+	if mesh and mesh.get(GEOMETRY_HASH_PROP) == geometry_hash:
+		return mesh
+
+def get_skeleton_hash(armature: Armature) -> str:
+	"""Hash of the bone names, hierarchy and rest pose of an armature."""
+	hasher = hashlib.sha1()
+	for bone in armature.bones:
+		hasher.update(f"{bone.name}<{bone.parent.name if bone.parent else ''};".encode())
+	hash_buffer(hasher, armature.bones, 'head_local', 'float32', 3)
+	hash_buffer(hasher, armature.bones, 'tail_local', 'float32', 3)
+	hash_buffer(hasher, armature.bones, 'matrix_local', 'float32', 16)
+	return hasher.hexdigest()
+
+def get_skeleton_index() -> Dict[str, str]:
+	"""Map the skeleton hashes of already imported armature objects to the object names.
+	Like get_mesh_index(), build this once when importing many files."""
+	return {ob[SKELETON_HASH_PROP] : ob.name for ob in bpy.data.objects if ob.type == 'ARMATURE' and SKELETON_HASH_PROP in ob}
+
+def find_duplicate_skeleton(skeleton_index: Dict[str, str], skeleton_hash: str, ignore: Optional[Object] = None) -> Optional[Object]:
+	"""Find an armature object that was imported earlier with the same skeleton."""
+	ob = bpy.data.objects.get(skeleton_index.get(skeleton_hash, ""))
+	if ob and ob != ignore and ob.type == 'ARMATURE' and ob.get(SKELETON_HASH_PROP) == skeleton_hash:
+		return ob
@@ -138,4 +138,71 @@ def dicts_to_lists(data: Dict) -> Dict:
 			value = new_value
 			del data[key]
 		if type(value) == dict:
-			dicts_to_lists(value)
\ No newline at end of file
+			dicts_to_lists(value)
+
+def mat_info_to_params(mat_info):
+	tex_pars = mat_info.get('TextureParameterValues') or mat_info.get('CollectedTextureParameters')
+	vec_pars = mat_info.get('VectorParameterValues') or mat_info.get('CollectedVectorParameters')
+	scal_pars = mat_info.get('ScalarParameterValues') or mat_info.get('CollectedScalarParameters')
+
+	processed_tex = {}
+	processed_vec = {}
+	processed_scal = {}
+
+	if tex_pars:
+		for tex_param in tex_pars:
+			name = tex_param.get("Name") or tex_param.get("ParameterInfo").get("Name")
+			value = tex_param.get("Texture") or tex_param.get("ParameterValue")
+			if not value:
+				processed_tex[name] = None
+				continue
+			value = value.split("'")[1].split(".")[0] + ".tga"
+			processed_tex[name] = value
+
+	if vec_pars:
+		for vec_param in vec_pars:
+			name = vec_param.get("Name") or vec_param.get("ParameterInfo").get("Name")
+			value = vec_param.get("Value") or vec_param.get("ParameterValue")
+			value = [value['R'], value['G'], value['B'], value['A']]
+			processed_vec[name] = value
+
+	if scal_pars:
+		for scalar_param in scal_pars:
+			name = scalar_param.get("Name") or scalar_param.get("ParameterInfo").get("Name")
+			value = scalar_param.get("Value") or scalar_param.get("ParameterValue")
+			if not value:
+				continue
+			processed_scal[name] = value
+
+	# Sometimes master materials have a ReferencedTextures block within their CachedExpressionData block
+	# without having any CollectedTextureParameters.
+	# In this case the type of each texture is also not indicated, leaving us to guess by filename...
+	cached_exp_data = mat_info.get('CachedExpressionData')
+	if cached_exp_data:
+		tex_list = cached_exp_data.get('ReferencedTextures')
+		if tex_list:
+			for tex_path in tex_list:
+				value = tex_path.split("'")[1].split(".")[0] + ".tga"
+
+				name = ""
+				# Guess the texture type name
+				if value.endswith("_D.tga") or value.endswith("_D_A.tga") or 'diffuse' in value.lower():
+					name = 'Diffuse'
+				elif value.endswith("_H_R_AO.tga"):
+					name = 'H_R_AO'
+				elif value.endswith("_M_R_AO.tga"):
+					name = 'M_R_AO'
+				elif value.endswith("_AO_R_M.tga"):
+					name = 'AO_R_M'
+				elif value.endswith("_N.tga"):
+					name = 'Normal'
+				elif value.endswith("_E.tga"):
+					name = 'Emission'
+
+				if name=="" or name in processed_tex:
+					name = 'Unknown'
+
+				if name not in processed_tex:
+					processed_tex[name] = value
+
+	return processed_tex, processed_vec, processed_scal
@@ -0,0 +1,61 @@
+# Minimal reader for the chunks of .psk/.pskx files written by umodel.
+# This is not an importer, it's for when we only need some of the data, without
+# going through the .psk importer addon. Nothing in here may import bpy.
+
+from typing import Dict, List, NamedTuple
+from array import array
+import struct, sys
+
+CHUNK_HEADER = struct.Struct("<20siii")
+
+class PskChunk(NamedTuple):
+	name: str
+	type_flag: int
+	data_size: int	# Size of a single element in bytes.
+	data_count: int	# Number of elements.
+	offset: int		# Offset of the data in the file, right after the header.
+
+def read_chunk_headers(filepath: str) -> Dict[str, PskChunk]:
+	"""Read the header of every chunk in the file, without reading their data."""
+	chunks = {}
+	with open(filepath, 'rb') as f:
+		while True:
+			header = f.read(CHUNK_HEADER.size)
+			if len(header) < CHUNK_HEADER.size:
+				break
+			name, type_flag, data_size, data_count = CHUNK_HEADER.unpack(header)
+			name = name.split(b"\0", 1)[0].decode('ascii', errors='replace')
+			chunks[name] = PskChunk(name, type_flag, data_size, data_count, f.tell())
+			f.seek(data_size * data_count, 1)
+	return chunks
+
+def read_chunk_data(filepath: str, chunk: PskChunk) -> bytes:
+	with open(filepath, 'rb') as f:
+		f.seek(chunk.offset)
+		return f.read(chunk.data_size * chunk.data_count)
+
+def read_points(filepath: str) -> array:
+	"""Return the vertex positions of a .psk file as a flat array of floats (x, y, z, x, y, z, ...)."""
+	chunks = read_chunk_headers(filepath)
+	chunk = chunks.get("PNTS0000")
+	points = array('f')
+	if not chunk:
+		return points
+	points.frombytes(read_chunk_data(filepath, chunk))
+	if sys.byteorder != 'little':
+		points.byteswap()
+	return points
+
+def read_material_names(filepath: str) -> List[str]:
+	"""Return the names of the materials used by a .psk file."""
+	chunks = read_chunk_headers(filepath)
+	chunk = chunks.get("MATT0000")
+	if not chunk:
+		return []
+	data = read_chunk_data(filepath, chunk)
+	names = []
+	for i in range(chunk.data_count):
+		# Each material starts with a 64 byte name.
+		raw_name = data[i*chunk.data_size : i*chunk.data_size + 64]
+		names.append(raw_name.split(b"\0", 1)[0].decode('ascii', errors='replace'))
+	return names
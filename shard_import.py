@@ -0,0 +1,333 @@
+from typing import List, Dict, Tuple, Optional
+from bpy.types import ID
+
+import bpy, os, json, shutil
+from datetime import datetime
+
+from .utils import get_extract_path, set_extract_path
+from .extract_files import find_psk_files_to_import
+from .asset_catalogs import AssetCatalog, AssetCatalogs
+from .blender_workers import worker_command, run_worker_pool
+from .import_journal import ImportJournal, read_journal_entries
+from .import_profiler import start_profiling, stop_profiling
+from .import_schedule import CostModel, schedule_jobs
+from .import_plan import make_parent_lookup
+from .kena_generate_catalogs import (
+	ASSET_FILENAME, get_catalog_filepath, read_catalogs,
+	map_catalogs_to_collections, import_jobs
+)
+
+SHARD_PLAN_FILENAME = "shard_plan.json"
+
+# Budget of source bytes for each library .blend file, before a top-level catalog rolls over into another file.
+LIBRARY_FILE_BYTES = 500 * 1024 * 1024
+
+def split_by_size(jobs: List[Tuple[str, AssetCatalog]], shard_count: int) -> List[List[Tuple[str, AssetCatalog]]]:
+	"""Split the files into shards with roughly the same amount of source bytes.
+	Files stay in walk order, so neighbouring files (which tend to share materials) end up together.
+	"""
+	groups = [([job], os.path.getsize(job[0])) for job in jobs]
+	return split_groups(groups, shard_count)
+
+def split_by_catalog(jobs: List[Tuple[str, AssetCatalog]], shard_count: int) -> List[List[Tuple[str, AssetCatalog]]]:
+	"""Split the files into shards without splitting any catalog across shards."""
+	by_catalog = {}
+	for job in jobs:
+		by_catalog.setdefault(job[1], []).append(job)
+	groups = [(cat_jobs, sum(os.path.getsize(j[0]) for j in cat_jobs)) for cat_jobs in by_catalog.values()]
+	return split_groups(groups, shard_count)
+
+def split_by_cost(jobs: List[Tuple[str, AssetCatalog]], shard_count: int, output_dir: str, extract_path: str) -> List[List[Tuple[str, AssetCatalog]]]:
+	"""Balance shards by the estimated import time of each file, using the profile reports
+	of earlier runs in output_dir if there are any, and keep files that share parent materials together."""
+	reports = [os.path.join(output_dir, f) for f in os.listdir(output_dir) if f.endswith(".import_profile.jsonl")]
+	cost_model = CostModel.from_profile_reports(reports)
+	return schedule_jobs(jobs, shard_count, cost_model, make_parent_lookup(extract_path))
+
+def split_by_top_level_catalog(jobs: List[Tuple[str, AssetCatalog]], max_bytes: int) -> List[Tuple[str, List[Tuple[str, AssetCatalog]]]]:
+	"""Split the files into one named shard per top-level catalog, eg. "Characters".
+	When a shard's source files go over max_bytes, the rest goes into "Characters_002" and so on.
+	Sub-catalogs are kept together and in order, so a roll-over only splits a sub-catalog if it is too big on its own.
+	"""
+	by_top_level: Dict[str, List[Tuple[str, AssetCatalog]]] = {}
+	for job in jobs:
+		by_top_level.setdefault(job[1].name_chain[0], []).append(job)
+
+	named_shards = []
+	for top_name, top_jobs in sorted(by_top_level.items()):
+		top_jobs.sort(key=lambda job: (job[1].path, job[0]))
+		shards = [[]]
+		shard_size = 0
+		for job in top_jobs:
+			size = os.path.getsize(job[0])
+			if shards[-1] and shard_size + size > max_bytes:
+				shards.append([])
+				shard_size = 0
+			shards[-1].append(job)
+			shard_size += size
+		for i, shard in enumerate(shards):
+			name = bpy.path.clean_name(top_name)
+			if i > 0:
+				name += f"_{i+1:03}"
+			named_shards.append((name, shard))
+	return named_shards
+
+def split_groups(groups: List[Tuple[List, int]], shard_count: int) -> List[List]:
+	"""Fill shards with consecutive (items, size) groups until each shard has its share of the total size."""
+	total_size = sum(size for items, size in groups)
+	target = total_size / max(1, shard_count)
+
+	shards = [[]]
+	shard_size = 0
+	for items, size in groups:
+		if shard_size >= target and len(shards) < shard_count:
+			shards.append([])
+			shard_size = 0
+		shards[-1].extend(items)
+		shard_size += size
+
+	return [s for s in shards if s]
+
+def import_sharded(context
+		,output_dir: str
+		,name_chains: List[List[str]]=[]
+		,worker_count = os.cpu_count()
+		,split = 'COST'
+		,merge = False
+		,resume = True
+	) -> Dict[str, List[str]]:
+	"""Import the extract folder using several background Blender processes at once.
+
+	Each shard of files is imported by its own `blender -b` worker into its own .blend file in output_dir.
+	The catalog file is copied next to them, so output_dir can be used as an asset library directly.
+	If merge is True, the shards are appended into the current file at the end.
+
+	split can be 'COST', 'SIZE' or 'CATALOG'. Splitting by cost balances the estimated import time of the shards
+	and keeps files that share materials together. Splitting by catalog keeps each catalog in a single file.
+	If resume is True, shards that already exist in output_dir with the same list of files
+	continue from their last checkpoint, instead of starting over.
+	Returns the list of failed files of each shard.
+	"""
+	extract_path = get_extract_path(context)
+	catalogs = read_catalogs()
+	jobs = find_psk_files_to_import(extract_path, catalogs, name_chains)
+
+	output_dir = os.path.abspath(output_dir)
+	os.makedirs(output_dir, exist_ok=True)
+
+	plan_path = os.path.join(output_dir, SHARD_PLAN_FILENAME)
+	shards = load_shard_plan(plan_path, jobs, split, worker_count) if resume else None
+	if shards:
+		print("Resuming with the shards of the previous run.")
+	else:
+		if split == 'CATALOG':
+			shards = split_by_catalog(jobs, worker_count)
+		elif split == 'SIZE':
+			shards = split_by_size(jobs, worker_count)
+		else:
+			shards = split_by_cost(jobs, worker_count, output_dir, extract_path)
+		save_shard_plan(plan_path, shards, split, worker_count)
+	named_shards = [(f"shard_{i:03}", shard) for i, shard in enumerate(shards)]
+	failures, blend_paths = run_shards(extract_path, output_dir, named_shards, worker_count, resume)
+
+	if merge:
+		merge_shards(context, blend_paths)
+
+	return failures
+
+def save_shard_plan(plan_path: str, shards: List[List[Tuple[str, AssetCatalog]]], split: str, worker_count: int):
+	plan = {
+		'split' : split
+		,'worker_count' : worker_count
+		,'shards' : [[(filepath, cat.uuid) for filepath, cat in shard] for shard in shards]
+	}
+	with open(plan_path, 'w') as f:
+		json.dump(plan, f)
+
+def load_shard_plan(plan_path: str, jobs: List[Tuple[str, AssetCatalog]], split: str, worker_count: int) -> Optional[List[List[Tuple[str, AssetCatalog]]]]:
+	"""Return the shards of an earlier run with the same settings and the same files, if there was one.
+	Splitting again would give different shards, since the cost model learns from the interrupted run's profile reports,
+	and then no shard could be resumed."""
+	if not os.path.isfile(plan_path):
+		return None
+	with open(plan_path) as f:
+		plan = json.load(f)
+	if plan['split'] != split or plan['worker_count'] != worker_count:
+		return None
+	by_file = {(filepath, cat.uuid) : (filepath, cat) for filepath, cat in jobs}
+	planned = [(filepath, uuid) for shard in plan['shards'] for filepath, uuid in shard]
+	if len(planned) != len(by_file) or set(planned) != set(by_file):
+		return None
+	return [[by_file[(filepath, uuid)] for filepath, uuid in shard] for shard in plan['shards']]
+
+def import_library(context
+		,library_dir: str
+		,name_chains: List[List[str]]=[]
+		,worker_count = os.cpu_count()
+		,max_bytes = LIBRARY_FILE_BYTES
+		,resume = True
+	) -> Dict[str, List[str]]:
+	"""Import the extract folder into an asset library directory, with one .blend file per top-level catalog.
+
+	Unlike import_sharded(), the files are split by what they are, rather than by how long they take,
+	so the asset browser can load each catalog on its own, and no single file grows with the whole library.
+	A catalog whose source files add up to more than max_bytes rolls over into more files.
+	All files share the catalog file that is copied into library_dir.
+	Returns the list of failed files of each library file.
+	"""
+	extract_path = get_extract_path(context)
+	catalogs = read_catalogs()
+	jobs = find_psk_files_to_import(extract_path, catalogs, name_chains)
+
+	library_dir = os.path.abspath(library_dir)
+	os.makedirs(library_dir, exist_ok=True)
+
+	named_shards = split_by_top_level_catalog(jobs, max_bytes)
+	failures, blend_paths = run_shards(extract_path, library_dir, named_shards, worker_count, resume)
+	print(f"Wrote {len(blend_paths)} library files to {library_dir}")
+	return failures
+
+def run_shards(
+		extract_path: str
+		,output_dir: str
+		,named_shards: List[Tuple[str, List[Tuple[str, AssetCatalog]]]]
+		,worker_count: int
+		,resume = True
+	) -> Tuple[Dict[str, List[str]], List[str]]:
+	"""Import each shard into output_dir/<name>.blend with background workers.
+	Returns the list of failed files of each shard, and the paths of the shard .blend files."""
+	catalog_path = os.path.join(output_dir, ASSET_FILENAME)
+	shutil.copyfile(get_catalog_filepath(), catalog_path)
+
+	commands = []
+	result_paths = {}
+	blend_paths = []
+	for name, shard in named_shards:
+		job_path = os.path.join(output_dir, name + ".job.json")
+		result_path = os.path.join(output_dir, name + ".import_journal.jsonl")
+		blend_path = os.path.join(output_dir, name + ".blend")
+		job = {
+			'extract_path' : extract_path
+			,'blend_path' : blend_path
+			,'result_path' : result_path
+			,'catalog_path' : catalog_path
+			,'files' : [(filepath, cat.uuid) for filepath, cat in shard]
+		}
+		if not (resume and is_same_job(job_path, job)):
+			for path in (result_path, blend_path):
+				if os.path.isfile(path):
+					os.remove(path)
+		with open(job_path, 'w') as f:
+			json.dump(job, f, indent=4)
+
+		cmd = worker_command('shard_import', 'run_worker', job_path)
+		commands.append((name, cmd, os.path.join(output_dir, name + ".log")))
+		result_paths[name] = result_path
+		blend_paths.append(blend_path)
+
+	jobs = [job for name, shard in named_shards for job in shard]
+	print(f"Importing {len(jobs)} files in {len(named_shards)} shards, {worker_count} at a time.")
+	last_report = [""]
+	def report_progress(return_codes):
+		results = {name: read_results(path) for name, path in result_paths.items()}
+		done = sum(len(r) for r in results.values())
+		failed = sum(1 for r in results.values() for entry in r if entry['status'] == 'failed')
+		report = f"Shards: {len(return_codes)}/{len(named_shards)} finished, files: {done}/{len(jobs)}, failed: {failed}"
+		if report != last_report[0]:
+			now = datetime.now().strftime("%H:%M:%S")
+			print(f"{now} {report}")
+			last_report[0] = report
+
+	return_codes = run_worker_pool(commands, worker_count, on_poll=report_progress)
+
+	failures = {}
+	for name, result_path in result_paths.items():
+		failed = [entry['file'] for entry in read_results(result_path) if entry['status'] == 'failed']
+		if return_codes[name] != 0:
+			print(f"Worker {name} exited with code {return_codes[name]}, see {name}.log")
+		if failed:
+			print(f"{name} failed to import {len(failed)} files:")
+			for f in failed:
+				print("    ", f)
+		failures[name] = failed
+
+	return failures, blend_paths
+
+def is_same_job(job_path: str, job: Dict) -> bool:
+	if not os.path.isfile(job_path):
+		return False
+	with open(job_path) as f:
+		old_job = json.load(f)
+	# Tuples become lists in JSON.
+	return old_job == json.loads(json.dumps(job))
+
+def read_results(result_path: str) -> List[Dict]:
+	"""Return the latest entry of each file in a shard's journal."""
+	latest = {entry['file'] : entry for entry in read_journal_entries(result_path)}
+	return list(latest.values())
+
+def run_worker(job_path: str):
+	"""Entry point of a worker process: import the files of one shard into a new .blend file."""
+	with open(job_path) as f:
+		job = json.load(f)
+
+	extract_path = job['extract_path']
+	set_extract_path(extract_path)
+
+	if os.path.isfile(job['blend_path']):
+		# Resume a shard that was interrupted.
+		bpy.ops.wm.open_mainfile(filepath=job['blend_path'])
+	else:
+		bpy.ops.wm.read_homefile(use_empty=True)
+		bpy.ops.wm.save_as_mainfile(filepath=job['blend_path'])
+
+	catalogs = AssetCatalogs.from_file(job['catalog_path'])
+	jobs = [(filepath, catalogs.get_by_uuid(uuid)) for filepath, uuid in job['files']]
+	# Only create the collections of the catalogs in this shard.
+	shard_catalogs = AssetCatalogs(list({cat.uuid : cat for filepath, cat in jobs}.values()))
+
+	context = bpy.context
+	cat_to_coll = map_catalogs_to_collections(context, shard_catalogs, extract_path)
+	journal = ImportJournal(job['result_path'])
+	start_profiling(os.path.splitext(job['blend_path'])[0] + ".import_profile.jsonl")
+	import_jobs(context, jobs, extract_path, cat_to_coll, journal)
+	stop_profiling()
+
+def merge_shards(context, blend_paths: List[str]):
+	"""Append the objects of each shard .blend into the current file,
+	sorting assets into the collections of their catalogs."""
+	id_to_coll = map_catalogs_to_collections(context, read_catalogs(), get_extract_path(context))
+
+	for blend_path in blend_paths:
+		if not os.path.isfile(blend_path):
+			continue
+		old_mats = set(bpy.data.materials)
+		old_imgs = set(bpy.data.images)
+		with bpy.data.libraries.load(blend_path, link=False) as (data_from, data_to):
+			data_to.objects = data_from.objects
+
+		for o in data_to.objects:
+			if not o:
+				continue
+			coll = context.scene.collection
+			if o.asset_data:
+				coll = id_to_coll.get(o.asset_data.catalog_id, coll)
+			coll.objects.link(o)
+			o.hide_viewport = True
+
+		# Shards that used the same material or texture each brought their own copy.
+		remap_duplicates(bpy.data.materials, [m for m in bpy.data.materials if m not in old_mats])
+		remap_duplicates(bpy.data.images, [i for i in bpy.data.images if i not in old_imgs])
+		print("Merged " + blend_path)
+
+def remap_duplicates(id_collection, new_ids: List[ID]):
+	"""Replace IDs named like "Name.001" with an already existing "Name"."""
+	for new_id in new_ids:
+		base_name, _, suffix = new_id.name.rpartition(".")
+		if not base_name or not suffix.isdigit():
+			continue
+		existing = id_collection.get(base_name)
+		if not existing or existing in new_ids:
+			continue
+		new_id.user_remap(existing)
+		id_collection.remove(new_id)
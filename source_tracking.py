@@ -0,0 +1,199 @@
+# Records which files of the extract folder an imported asset was made from, so that after a new
+# umodel extract, only the assets whose files actually changed have to be updated.
+# Nothing in here may import bpy.
+
+from typing import List, Dict, Set, Tuple, Optional, NamedTuple
+import os, json, hashlib
+
+try:
+	from .extract_files import get_material_map
+	from .import_plan import MaterialResolver
+except ImportError:
+	from extract_files import get_material_map
+	from import_plan import MaterialResolver
+
+SOURCE_PROP = "kena_source"
+
+# (path, size, mtime) : SHA-1 of the contents, so shared files like textures are hashed only once per session.
+FILE_HASHES: Dict[Tuple[str, int, int], str] = {}
+
+def hash_file(filepath: str) -> str:
+	stat = os.stat(filepath)
+	key = (filepath, stat.st_size, stat.st_mtime_ns)
+	if key not in FILE_HASHES:
+		hasher = hashlib.sha1()
+		with open(filepath, 'rb') as f:
+			for block in iter(lambda: f.read(1 << 20), b""):
+				hasher.update(block)
+		FILE_HASHES[key] = hasher.hexdigest()
+	return FILE_HASHES[key]
+
+HASH_CACHE_FILENAME = "kena_file_hashes.json"
+
+class FileHashCache:
+	"""Hashes of the files of an extract folder by path, size and modification time, kept in a file
+	in that folder, so the sources of an asset can be recorded without hashing unchanged files again
+	in every session. Background workers share the folder, so saving merges with what's already saved.
+	"""
+
+	def __init__(self, extract_path: str):
+		self.extract_path = extract_path
+		self.cache_path = os.path.join(extract_path, HASH_CACHE_FILENAME)
+		self.file_hashes: Dict[str, List] = self.read()	# Path relative to the extract folder : [size, mtime, hash]
+		self.dirty = False
+
+	def read(self) -> Dict[str, List]:
+		if not os.path.isfile(self.cache_path):
+			return {}
+		try:
+			with open(self.cache_path) as f:
+				return json.load(f)
+		except ValueError:
+			print("Corrupt file hash cache, starting over: " + self.cache_path)
+			return {}
+
+	def save(self):
+		if not self.dirty:
+			return
+		file_hashes = self.read()
+		file_hashes.update(self.file_hashes)
+		tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+		try:
+			with open(tmp_path, 'w') as f:
+				json.dump(file_hashes, f)
+			os.replace(tmp_path, self.cache_path)
+		except OSError as e:
+			print(f"Failed to save the file hash cache: {e}")
+			return
+		self.file_hashes = file_hashes
+		self.dirty = False
+
+	def get_hash(self, filepath: str, stat: os.stat_result) -> str:
+		rel_path = os.path.relpath(filepath, self.extract_path)
+		record = self.file_hashes.get(rel_path)
+		if record and record[0] == stat.st_size and record[1] == stat.st_mtime_ns:
+			return record[2]
+		file_hash = hash_file(filepath)
+		self.file_hashes[rel_path] = [stat.st_size, stat.st_mtime_ns, file_hash]
+		self.dirty = True
+		return file_hash
+
+HASH_CACHES: Dict[str, FileHashCache] = {}
+
+def get_hash_cache(extract_path: str) -> FileHashCache:
+	extract_path = os.path.abspath(extract_path)
+	if extract_path not in HASH_CACHES:
+		HASH_CACHES[extract_path] = FileHashCache(extract_path)
+	return HASH_CACHES[extract_path]
+
+def save_hash_caches():
+	for cache in HASH_CACHES.values():
+		cache.save()
+
+class SourceChanges(NamedTuple):
+	geometry: bool			# The .psk file changed, the asset has to be re-imported.
+	materials: Set[str]		# Names of materials whose .props.txt files changed.
+	textures: Set[str]		# Texture paths relative to the extract folder, whose files changed.
+
+	def __bool__(self):
+		return self.geometry or bool(self.materials) or bool(self.textures)
+
+class SourceTracker:
+	"""Collects the .psk, .props.txt and texture files an asset depends on, as paths relative
+	to the extract folder, and compares them against the current contents of the extract folder.
+	"""
+
+	def __init__(self, extract_path: str, refresh=False):
+		self.extract_path = os.path.abspath(extract_path)
+		self.resolver = MaterialResolver(self.extract_path, get_material_map(self.extract_path, refresh))
+		self.hashes = get_hash_cache(self.extract_path)
+
+	def rel_path(self, filepath: str) -> str:
+		return os.path.relpath(filepath, self.extract_path)
+
+	def abs_path(self, rel_path: str) -> str:
+		return os.path.join(self.extract_path, rel_path)
+
+	def material_files(self, mat_name: str) -> Tuple[List[str], List[str]]:
+		"""Return the relative .props.txt paths and texture paths a material is made from."""
+		props = [self.rel_path(props_path) for props_path, mat_info in self.resolver.walk(mat_name)]
+		textures = self.resolver.resolve(mat_name)[1]
+		return props, textures
+
+	def file_record(self, filepath: str) -> Optional[List]:
+		"""Size, modification time and hash of a file, or None if it doesn't exist."""
+		if not os.path.isfile(filepath):
+			return None
+		stat = os.stat(filepath)
+		return [stat.st_size, stat.st_mtime_ns, self.hashes.get_hash(filepath, stat)]
+
+	def file_changed(self, filepath: str, record: Optional[List]) -> bool:
+		"""Compare a file with its record. A new extract rewrites every file, so when only
+		the modification time is different, the contents are compared by their hash."""
+		if not os.path.isfile(filepath):
+			return record is not None
+		if record is None:
+			return True
+		size, mtime, file_hash = record
+		stat = os.stat(filepath)
+		if stat.st_size != size:
+			return True
+		if stat.st_mtime_ns == mtime:
+			return False
+		return self.hashes.get_hash(filepath, stat) != file_hash
+
+	def get_sources(self, psk_path: str, mat_names: List[str]) -> Dict:
+		"""Return the records of all files an asset imported from psk_path with these materials depends on."""
+		materials = {}
+		textures = {}
+		for mat_name in mat_names:
+			props, tex_paths = self.material_files(mat_name)
+			materials[mat_name] = {rel_path : self.file_record(self.abs_path(rel_path)) for rel_path in props}
+			for tex_path in tex_paths:
+				if tex_path not in textures:
+					textures[tex_path] = self.file_record(self.abs_path(tex_path))
+		return {
+			'psk' : [self.rel_path(psk_path), self.file_record(psk_path)]
+			,'materials' : materials
+			,'textures' : textures
+		}
+
+	def get_changes(self, sources: Dict) -> SourceChanges:
+		psk_rel_path, psk_record = sources['psk']
+		geometry = self.file_changed(self.abs_path(psk_rel_path), psk_record)
+
+		materials = set()
+		textures = set()
+		for mat_name, props in sources['materials'].items():
+			current_props, current_textures = self.material_files(mat_name)
+			if set(current_props) != set(props) or set(current_textures) - set(sources['textures']):
+				# Parent materials or texture assignments changed.
+				materials.add(mat_name)
+				continue
+			if any(self.file_changed(self.abs_path(rel_path), record) for rel_path, record in props.items()):
+				materials.add(mat_name)
+
+		for tex_path, record in sources['textures'].items():
+			if self.file_changed(self.abs_path(tex_path), record):
+				textures.add(tex_path)
+
+		return SourceChanges(geometry, materials, textures)
+
+def sources_to_string(sources: Dict) -> str:
+	return json.dumps(sources, separators=(',', ':'))
+
+def string_to_sources(string: str) -> Optional[Dict]:
+	try:
+		return json.loads(string)
+	except ValueError:
+		return None
+
+TRACKERS: Dict[str, SourceTracker] = {}
+
+def get_source_tracker(extract_path: str, refresh=False) -> SourceTracker:
+	"""Keep one tracker per extract folder, so material files are parsed only once during a batch import.
+	Use refresh=True after the contents of the extract folder changed."""
+	extract_path = os.path.abspath(extract_path)
+	if refresh or extract_path not in TRACKERS:
+		TRACKERS[extract_path] = SourceTracker(extract_path, refresh)
+	return TRACKERS[extract_path]
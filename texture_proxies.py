@@ -0,0 +1,190 @@
+from typing import List, Tuple
+from bpy.types import Image, Operator
+from bpy.props import IntProperty, EnumProperty
+
+import bpy, os, json
+from datetime import datetime
+
+from .blender_workers import worker_command, run_worker_pool
+
+# Downscaled copies of the local textures, for browsing the library without loading every texture at full size.
+PROXY_SCALES = {
+	'QUARTER' : 4
+	,'EIGHTH' : 8
+}
+RESOLUTION_ITEMS = [
+	('FULL', "Full", "Full resolution textures")
+	,('QUARTER', "1/4", "Textures at a quarter of their resolution")
+	,('EIGHTH', "1/8", "Textures at an eighth of their resolution")
+]
+LOCAL_TEXTURE_DIRS = ["textures_ue", "textures_compressed"]
+FULL_RES_PATH_PROP = "full_res_path"
+RESOLUTION_PROP = "kena_texture_resolution"
+
+def get_proxy_dir(scale: int) -> str:
+	return f"textures_proxy_{scale}"
+
+def get_full_res_path(img: Image) -> str:
+	return img.get(FULL_RES_PATH_PROP, img.filepath)
+
+def is_local_texture(filepath: str) -> bool:
+	return any(filepath.startswith("//" + dir_name) for dir_name in LOCAL_TEXTURE_DIRS)
+
+def get_proxy_path(full_res_path: str, scale: int) -> str:
+	"""//textures_ue/Game/T_Rock.tga -> //textures_proxy_4/textures_ue/Game/T_Rock.tga"""
+	return "//" + get_proxy_dir(scale) + "/" + full_res_path[2:]
+
+def get_proxy_jobs() -> List[Tuple[str, List[str]]]:
+	"""Return (source, [proxy paths]) for every local texture whose proxies are missing or older than it."""
+	jobs = []
+	seen = set()
+	for img in bpy.data.images:
+		full_res_path = get_full_res_path(img)
+		if not is_local_texture(full_res_path) or img.library:
+			continue
+		src = os.path.normpath(bpy.path.abspath(full_res_path))
+		if src in seen or not os.path.isfile(src):
+			continue
+		seen.add(src)
+		src_mtime = os.path.getmtime(src)
+		dsts = [os.path.normpath(bpy.path.abspath(get_proxy_path(full_res_path, scale))) for scale in PROXY_SCALES.values()]
+		if all(os.path.isfile(dst) and os.path.getmtime(dst) >= src_mtime for dst in dsts):
+			continue
+		jobs.append((src, dsts))
+	return jobs
+
+def build_texture_proxies(worker_count = os.cpu_count()) -> int:
+	"""Write the downscaled textures in background Blender processes. They only need Blender's image
+	library, so they start from factory settings, without opening the .blend file.
+	Returns the number of textures that were processed."""
+	assert bpy.data.is_saved, "The .blend file must be saved, since the proxies are stored next to it."
+	jobs = get_proxy_jobs()
+	if not jobs:
+		print("All texture proxies are up to date.")
+		return 0
+
+	# Deal out big textures first, so every worker gets a similar amount of pixels.
+	jobs.sort(key=lambda job: os.path.getsize(job[0]), reverse=True)
+	shards = [jobs[i::worker_count] for i in range(worker_count)]
+	shards = [s for s in shards if s]
+
+	work_dir = os.path.join(os.path.dirname(bpy.data.filepath), get_proxy_dir(PROXY_SCALES['QUARTER']))
+	os.makedirs(work_dir, exist_ok=True)
+	commands = []
+	for i, shard in enumerate(shards):
+		name = f"proxies_{i:03}"
+		job_path = os.path.join(work_dir, name + ".job.json")
+		with open(job_path, 'w') as f:
+			json.dump({'files' : shard, 'scales' : list(PROXY_SCALES.values())}, f)
+		cmd = worker_command('texture_proxies', 'run_worker', job_path, factory_startup=True, enable_addon=False)
+		commands.append((name, cmd, os.path.join(work_dir, name + ".log")))
+
+	print(f"Building proxies of {len(jobs)} textures in {len(shards)} processes.")
+	return_codes = run_worker_pool(commands, worker_count)
+	for name, code in return_codes.items():
+		if code != 0:
+			print(f"Worker {name} exited with code {code}, see {name}.log")
+	return len(jobs)
+
+def run_worker(job_path: str):
+	"""Entry point of a worker process: downscale each texture to each proxy scale."""
+	import imbuf
+	with open(job_path) as f:
+		job = json.load(f)
+
+	for i, (src, dsts) in enumerate(job['files']):
+		try:
+			ibuf = imbuf.load(src)
+		except (OSError, ValueError) as e:
+			print(f"Failed to load {src}: {e}")
+			continue
+		width, height = ibuf.size
+		for scale, dst in zip(job['scales'], dsts):
+			proxy = ibuf.copy()
+			proxy.resize((max(1, width // scale), max(1, height // scale)), method='BILINEAR')
+			os.makedirs(os.path.dirname(dst), exist_ok=True)
+			imbuf.write(proxy, filepath=dst)
+			proxy.free()
+		ibuf.free()
+		now = datetime.now().strftime("%H:%M:%S")
+		print(f"{now} {i+1}/{len(job['files'])} {src}")
+
+def apply_texture_resolution(img: Image, resolution: str) -> bool:
+	"""Point an image to its full resolution file or to one of its proxies, if that exists.
+	Returns whether the filepath changed."""
+	full_res_path = get_full_res_path(img)
+	if not is_local_texture(full_res_path) or img.library:
+		return False
+	if resolution == 'FULL':
+		new_path = full_res_path
+	else:
+		new_path = get_proxy_path(full_res_path, PROXY_SCALES[resolution])
+		if not os.path.isfile(bpy.path.abspath(new_path)):
+			new_path = full_res_path
+	if new_path == img.filepath:
+		return False
+	img[FULL_RES_PATH_PROP] = full_res_path
+	img.filepath = new_path
+	return True
+
+def set_full_res_path(img: Image, filepath: str):
+	"""Point an image to a new full resolution file. Only meant while textures are at full resolution,
+	otherwise the next switch would go back to the old file."""
+	if FULL_RES_PATH_PROP in img:
+		img[FULL_RES_PATH_PROP] = filepath
+	img.filepath = filepath
+
+def get_texture_resolution(scene=None) -> str:
+	scene = scene or bpy.context.scene
+	return scene.get(RESOLUTION_PROP, 'FULL')
+
+def set_texture_resolution(resolution: str, scene=None) -> int:
+	"""Switch every local texture between full resolution and proxies. Returns the number of switched images."""
+	scene = scene or bpy.context.scene
+	scene[RESOLUTION_PROP] = resolution
+	count = sum(apply_texture_resolution(img, resolution) for img in bpy.data.images)
+	print(f"Switched {count} images to {resolution.lower()} resolution.")
+	return count
+
+class IMAGE_OT_build_kena_texture_proxies(Operator):
+	"""Write downscaled copies of every local texture, using several background Blender processes"""
+	bl_idname = "image.build_kena_texture_proxies"
+	bl_label = "Build Texture Proxies"
+
+	worker_count: IntProperty(
+		name="Processes"
+		,description="Number of Blender processes to downscale textures with"
+		,default=4
+		,min=1
+	)
+
+	def invoke(self, context, event):
+		return context.window_manager.invoke_props_dialog(self)
+
+	def execute(self, context):
+		count = build_texture_proxies(self.worker_count)
+		set_texture_resolution(get_texture_resolution(context.scene), context.scene)
+		self.report({'INFO'}, f"Built proxies of {count} textures.")
+		return {'FINISHED'}
+
+class IMAGE_OT_set_kena_texture_resolution(Operator):
+	"""Switch all local textures between full resolution and downscaled proxies"""
+	bl_idname = "image.set_kena_texture_resolution"
+	bl_label = "Set Texture Resolution"
+	bl_options = {'REGISTER', 'UNDO'}
+
+	resolution: EnumProperty(
+		name="Resolution"
+		,items=RESOLUTION_ITEMS
+		,default='QUARTER'
+	)
+
+	def execute(self, context):
+		count = set_texture_resolution(self.resolution, context.scene)
+		self.report({'INFO'}, f"Switched {count} images.")
+		return {'FINISHED'}
+
+registry = [
+	IMAGE_OT_build_kena_texture_proxies
+	,IMAGE_OT_set_kena_texture_resolution
+]
@@ -0,0 +1,115 @@
+# Content-addressed store of the textures copied next to the .blend file.
+# Many textures are byte-identical copies under different UE paths, so only the first copy
+# of each unique file is kept, and the others point to it. Nothing in here may import bpy.
+
+from typing import Dict, List, Optional
+import os, json, shutil
+
+try:
+	from .source_tracking import hash_file
+except ImportError:
+	from source_tracking import hash_file
+
+STORE_INDEX_FILENAME = "texture_store.json"
+
+class TextureStore:
+	"""The index is kept in the store folder: the hash of each stored file, and the hashes of
+	source files by path, size and modification time, so unchanged files are never hashed twice.
+	"""
+
+	def __init__(self, store_dir: str):
+		self.store_dir = store_dir
+		self.index_path = os.path.join(store_dir, STORE_INDEX_FILENAME)
+		self.stored: Dict[str, str] = {}			# Hash : path relative to store_dir
+		self.file_hashes: Dict[str, List] = {}		# Absolute source path : [size, mtime, hash]
+		self.dirty = False
+		self.load()
+
+	def read(self) -> Dict[str, Dict]:
+		if not os.path.isfile(self.index_path):
+			return {}
+		try:
+			with open(self.index_path) as f:
+				return json.load(f)
+		except ValueError:
+			print("Corrupt texture store index, starting over: " + self.index_path)
+			return {}
+
+	def load(self):
+		index = self.read()
+		self.stored = index.get('stored', {})
+		self.file_hashes = index.get('file_hashes', {})
+
+	def save(self):
+		"""Background workers share the store folder, so this merges with what's already saved."""
+		if not self.dirty:
+			return
+		index = self.read()
+		stored = index.get('stored', {})
+		stored.update(self.stored)
+		file_hashes = index.get('file_hashes', {})
+		file_hashes.update(self.file_hashes)
+		tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+		try:
+			os.makedirs(self.store_dir, exist_ok=True)
+			with open(tmp_path, 'w') as f:
+				json.dump({'stored' : stored, 'file_hashes' : file_hashes}, f)
+			os.replace(tmp_path, self.index_path)
+		except OSError as e:
+			print(f"Failed to save the texture store index: {e}")
+			return
+		self.stored = stored
+		self.file_hashes = file_hashes
+		self.dirty = False
+
+	def get_hash(self, filepath: str) -> str:
+		stat = os.stat(filepath)
+		record = self.file_hashes.get(filepath)
+		if record and record[0] == stat.st_size and record[1] == stat.st_mtime_ns:
+			return record[2]
+		file_hash = hash_file(filepath)
+		self.file_hashes[filepath] = [stat.st_size, stat.st_mtime_ns, file_hash]
+		self.dirty = True
+		return file_hash
+
+	def get_stored_path(self, file_hash: str) -> Optional[str]:
+		rel_path = self.stored.get(file_hash)
+		if rel_path and os.path.isfile(os.path.join(self.store_dir, rel_path)):
+			return rel_path
+
+	def add(self, src_path: str, rel_path: str) -> str:
+		"""Copy a file into the store at rel_path, unless a file with the same contents is already stored.
+		Returns the path of the stored file, relative to the store folder."""
+		file_hash = self.get_hash(src_path)
+		stored_path = self.get_stored_path(file_hash)
+		if stored_path:
+			return stored_path
+
+		dst_path = os.path.join(self.store_dir, rel_path)
+		if os.path.isfile(dst_path) and hash_file(dst_path) == file_hash:
+			# Copied before the store existed.
+			self.stored[file_hash] = rel_path
+			self.dirty = True
+			return rel_path
+		if os.path.exists(dst_path):
+			# Other images may point to the file that is already there, so it must not be overwritten.
+			root, ext = os.path.splitext(rel_path)
+			rel_path = f"{root}.{file_hash[:8]}{ext}"
+			dst_path = os.path.join(self.store_dir, rel_path)
+		os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+		shutil.copyfile(src_path, dst_path)
+		self.stored[file_hash] = rel_path
+		self.dirty = True
+		return rel_path
+
+STORES: Dict[str, TextureStore] = {}
+
+def get_texture_store(store_dir: str) -> TextureStore:
+	store_dir = os.path.abspath(store_dir)
+	if store_dir not in STORES:
+		STORES[store_dir] = TextureStore(store_dir)
+	return STORES[store_dir]
+
+def save_texture_stores():
+	for store in STORES.values():
+		store.save()
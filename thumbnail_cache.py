@@ -0,0 +1,109 @@
+# Thumbnails are cached by a hash of everything that affects how they look:
+# the mesh geometry, the materials, the object's rotation and scale, and the render settings.
+# Renaming an asset keeps its thumbnail, and changing it makes a new one.
+
+from typing import Tuple, Optional
+from bpy.types import Object, Material, NodeTree, Scene
+
+import bpy, os, hashlib
+
+from .mesh_hash import hash_mesh
+
+# Increase when the way thumbnails are framed or rendered changes, to invalidate all of them.
+THUMBNAIL_CACHE_VERSION = 1
+THUMBNAIL_KEY_PROP = "thumbnail_key"
+
+def get_thumbnail_dir() -> str:
+	"""Thumbnails are stored in a Thumbnails folder next to the folder of the .blend file."""
+	return os.path.join(os.path.dirname(os.path.dirname(bpy.data.filepath)), "Thumbnails")
+
+def get_thumbnail_path(key: str) -> str:
+	return os.path.join(get_thumbnail_dir(), key + ".png")
+
+def hash_value(hasher, value):
+	if hasattr(value, '__len__') and not isinstance(value, str):
+		value = tuple(value)
+	hasher.update(repr(value).encode())
+
+def hash_node_tree(hasher, node_tree: Optional[NodeTree]):
+	if not node_tree:
+		hasher.update(b"None")
+		return
+	for node in sorted(node_tree.nodes, key=lambda n: n.name):
+		hasher.update(node.bl_idname.encode())
+		image = getattr(node, 'image', None)
+		if image:
+			hasher.update(image.filepath.encode())
+			hash_value(hasher, image.colorspace_settings.name)
+		if node.bl_idname == 'ShaderNodeGroup':
+			hash_node_tree(hasher, node.node_tree)
+		for socket in node.inputs:
+			if not socket.is_linked and hasattr(socket, 'default_value'):
+				hash_value(hasher, socket.default_value)
+	for link in node_tree.links:
+		hasher.update(f"{link.from_node.name}.{link.from_socket.identifier}>{link.to_node.name}.{link.to_socket.identifier}".encode())
+
+def hash_material(hasher, mat: Optional[Material]):
+	if not mat:
+		hasher.update(b"None")
+		return
+	hasher.update(mat.blend_method.encode())
+	if mat.use_nodes:
+		hash_node_tree(hasher, mat.node_tree)
+	else:
+		hash_value(hasher, mat.diffuse_color)
+
+def hash_render_settings(hasher, scene: Scene):
+	render = scene.render
+	for value in (
+		render.engine
+		,render.resolution_x
+		,render.resolution_y
+		,render.resolution_percentage
+		,render.film_transparent
+		,scene.view_settings.view_transform
+		,scene.view_settings.look
+		,scene.view_settings.exposure
+	):
+		hash_value(hasher, value)
+	if render.engine == 'CYCLES':
+		hash_value(hasher, scene.cycles.samples)
+	elif hasattr(scene, 'eevee'):
+		hash_value(hasher, scene.eevee.taa_render_samples)
+
+	if scene.world:
+		hash_node_tree(hasher, scene.world.node_tree if scene.world.use_nodes else None)
+	camera = scene.camera
+	if camera:
+		hash_value(hasher, camera.data.type)
+		hash_value(hasher, camera.data.lens)
+		hash_value(hasher, camera.data.sensor_width)
+		hash_value(hasher, camera.matrix_world.to_quaternion())
+
+def get_thumbnail_key(ob: Object, scene: Scene) -> str:
+	"""Hash of everything that affects the thumbnail of an object, but not its name or location."""
+	hasher = hashlib.sha1()
+	hash_value(hasher, THUMBNAIL_CACHE_VERSION)
+	hash_mesh(hasher, ob.data)
+	for slot in ob.material_slots:
+		hash_material(hasher, slot.material)
+	hash_value(hasher, ob.matrix_world.to_quaternion())
+	hash_value(hasher, ob.matrix_world.to_scale())
+	for mod in ob.modifiers:
+		hasher.update(mod.type.encode())
+	hash_render_settings(hasher, scene)
+	return hasher.hexdigest()
+
+def get_cached_thumbnail(ob: Object, scene: Scene) -> Tuple[str, str, bool]:
+	"""Return the key, the thumbnail path, and whether the thumbnail is already rendered."""
+	key = get_thumbnail_key(ob, scene)
+	filepath = get_thumbnail_path(key)
+	return key, filepath, os.path.isfile(filepath)
+
+def load_thumbnail(ob: Object, key: str, filepath: str, force=False):
+	"""Load a rendered thumbnail as the custom preview of an object, unless it's already loaded.
+	Use force=True after rendering over the file of the same key."""
+	if not force and ob.get(THUMBNAIL_KEY_PROP) == key and ob.preview:
+		return
+	bpy.ops.ed.lib_id_load_custom_preview({"id": ob}, filepath=filepath)
+	ob[THUMBNAIL_KEY_PROP] = key
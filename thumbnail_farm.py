@@ -0,0 +1,249 @@
+from typing import List, Dict, Tuple
+from bpy.types import Object, Operator
+from bpy.props import IntProperty
+
+import bpy, os, json, time
+from math import sin, tan, atan
+from mathutils import Vector
+from datetime import datetime
+
+from .thumbnail_cache import get_thumbnail_dir, get_cached_thumbnail, load_thumbnail
+from .blender_workers import worker_command, run_worker_pool
+
+def get_farm_dir() -> str:
+	return os.path.join(get_thumbnail_dir(), "farm")
+
+def render_thumbnails_farm(context, worker_count = os.cpu_count()) -> int:
+	"""Render thumbnails of all mesh objects that don't have a cached one, using several background
+	Blender processes that each render a part of the objects from the saved .blend file.
+	Once they are done, the thumbnails are loaded as the custom previews of the objects.
+	Returns the number of loaded thumbnails.
+	"""
+	assert bpy.data.is_saved, "The .blend file must be saved, since the workers render from it."
+	if bpy.data.is_dirty:
+		bpy.ops.wm.save_mainfile()
+
+	thumbnails = {}	# Object name : (key, filepath)
+	to_render = {}	# Key : Object, so identical objects are rendered only once
+	for ob in bpy.data.objects:
+		if ob.type != 'MESH':
+			continue
+		key, filepath, is_cached = get_cached_thumbnail(ob, context.scene)
+		thumbnails[ob.name] = (key, filepath)
+		if not is_cached:
+			to_render.setdefault(key, ob)
+
+	objects = list(to_render.values())
+	if not objects:
+		print("All thumbnails are already rendered.")
+		return load_thumbnails(thumbnails)
+
+	# Spread the big meshes evenly across workers.
+	objects.sort(key=lambda o: len(o.data.vertices), reverse=True)
+	shards = [objects[i::worker_count] for i in range(worker_count)]
+	shards = [s for s in shards if s]
+
+	farm_dir = get_farm_dir()
+	os.makedirs(farm_dir, exist_ok=True)
+	commands = []
+	manifest_paths = []
+	for i, shard in enumerate(shards):
+		name = f"thumbnails_{i:03}"
+		job_path = os.path.join(farm_dir, name + ".job.json")
+		manifest_path = os.path.join(farm_dir, name + ".manifest.jsonl")
+		with open(job_path, 'w') as f:
+			job = {
+				'objects' : [(o.name, thumbnails[o.name][1]) for o in shard]
+				,'manifest_path' : manifest_path
+			}
+			json.dump(job, f, indent=4)
+		if os.path.isfile(manifest_path):
+			os.remove(manifest_path)
+		cmd = worker_command('thumbnail_farm', 'run_worker', job_path, blend_path=bpy.data.filepath, enable_addon=False)
+		commands.append((name, cmd, os.path.join(farm_dir, name + ".log")))
+		manifest_paths.append(manifest_path)
+
+	print(f"Rendering {len(objects)} thumbnails in {len(shards)} processes.")
+	last_count = [-1]
+	def report_progress(return_codes):
+		count = sum(len(read_manifest(path)) for path in manifest_paths)
+		if count != last_count[0]:
+			now = datetime.now().strftime("%H:%M:%S")
+			print(f"{now} Rendered {count}/{len(objects)} thumbnails")
+			last_count[0] = count
+
+	return_codes = run_worker_pool(commands, worker_count, on_poll=report_progress)
+	for name, code in return_codes.items():
+		if code != 0:
+			print(f"Worker {name} exited with code {code}, see {name}.log")
+
+	return load_thumbnails(thumbnails)
+
+def read_manifest(manifest_path: str) -> List[Dict]:
+	if not os.path.isfile(manifest_path):
+		return []
+	with open(manifest_path) as f:
+		return [json.loads(line) for line in f if line.strip()]
+
+def load_thumbnails(thumbnails: Dict[str, Tuple[str, str]]) -> int:
+	"""Load rendered thumbnails as the custom previews of their objects."""
+	count = 0
+	for ob_name, (key, filepath) in thumbnails.items():
+		ob = bpy.data.objects.get(ob_name)
+		if not ob or not os.path.isfile(filepath):
+			continue
+		load_thumbnail(ob, key, filepath)
+		count += 1
+	print(f"Loaded {count} thumbnails.")
+	return count
+
+def frame_object(camera: Object, ob: Object, margin=1.1):
+	"""Move the camera along its view direction so that the bounding sphere of the object fills the frame.
+	Works without a 3D viewport, unlike view3d.view_selected()."""
+	corners = [ob.matrix_world @ Vector(corner) for corner in ob.bound_box]
+	center = sum(corners, Vector()) / len(corners)
+	radius = max((corner - center).length for corner in corners) * margin
+	radius = max(radius, 0.001)
+
+	cam_data = camera.data
+	if cam_data.type == 'ORTHO':
+		cam_data.ortho_scale = radius * 2
+		distance = radius * 2
+	else:
+		# With automatic sensor fit, the field of view is that of the larger image dimension,
+		# so the smaller dimension limits the framing.
+		render = bpy.context.scene.render
+		width = render.resolution_x * render.pixel_aspect_x
+		height = render.resolution_y * render.pixel_aspect_y
+		ratio = min(width, height) / max(width, height)
+		fov = 2 * atan(tan(cam_data.angle / 2) * ratio)
+		distance = radius / sin(fov / 2)
+
+	forward = camera.matrix_world.to_quaternion() @ Vector((0, 0, -1))
+	camera.location = center - forward * distance
+	cam_data.clip_start = max(distance - radius, 0.001) * 0.5
+	cam_data.clip_end = (distance + radius) * 2
+
+def ensure_camera(context) -> Object:
+	scene = context.scene
+	if scene.camera:
+		return scene.camera
+	cam_data = bpy.data.cameras.new("Thumbnail Camera")
+	camera = bpy.data.objects.new("Thumbnail Camera", cam_data)
+	scene.collection.objects.link(camera)
+	# Front three-quarter view, looking slightly down.
+	camera.rotation_euler = (1.2, 0, 0.6)
+	scene.camera = camera
+	return camera
+
+def run_worker(job_path: str):
+	"""Entry point of a worker process: render the thumbnails of some objects of the opened .blend file.
+	The .blend file is not saved, the thumbnails are loaded by the coordinating process."""
+	with open(job_path) as f:
+		job = json.load(f)
+
+	context = bpy.context
+	scene = context.scene
+	camera = ensure_camera(context)
+	context.view_layer.update()
+
+	# Don't render the rest of the asset library along with each object.
+	for layer_coll in context.view_layer.layer_collection.children:
+		if any(o.asset_data for o in layer_coll.collection.all_objects):
+			layer_coll.exclude = True
+
+	with open(job['manifest_path'], 'a') as manifest:
+		for ob_name, filepath in job['objects']:
+			ob = bpy.data.objects.get(ob_name)
+			if not ob:
+				continue
+			start = time.time()
+
+			scene.collection.objects.link(ob)
+			ob.hide_viewport = False
+			ob.hide_render = False
+			context.view_layer.update()
+			frame_object(camera, ob)
+
+			scene.render.filepath = filepath
+			bpy.ops.render.render(write_still=True)
+			scene.collection.objects.unlink(ob)
+
+			entry = {'object' : ob.name, 'filepath' : filepath, 'seconds' : round(time.time() - start, 3)}
+			manifest.write(json.dumps(entry) + "\n")
+			manifest.flush()
+
+class VIEW3D_OT_render_thumbnails_farm(Operator):
+	"""Render the thumbnails of all mesh objects without one, using several background Blender processes. The file will be saved first"""
+	bl_idname = "view3d.render_thumbnails_farm"
+	bl_label = "Render Thumbnails in Background"
+
+	worker_count: IntProperty(
+		name="Processes"
+		,description="Number of Blender processes to render with"
+		,default=4
+		,min=1
+	)
+
+	def invoke(self, context, event):
+		return context.window_manager.invoke_props_dialog(self)
+
+	def execute(self, context):
+		count = render_thumbnails_farm(context, self.worker_count)
+		self.report({'INFO'}, f"Loaded {count} thumbnails.")
+		return {'FINISHED'}
+
+class RenderCyclesThumbnail(bpy.types.Operator):
+	bl_idname = 'view3d.render_cycles_thumbnail'
+	bl_label = "Render Cycles Thumbnail"
+
+	@classmethod
+	def poll(cls, context):
+		ob = context.object
+		return ob and ob.type == 'MESH' and context.area.ui_type == 'VIEW_3D'
+
+	def execute(self, context):
+		ob = context.object
+		
+		# Always render: this uses the current view, which isn't part of the cache key,
+		# and is how a thumbnail the farm framed badly gets replaced.
+		key, filepath, is_cached = get_cached_thumbnail(ob, context.scene)
+		context.scene.render.filepath = filepath
+		bpy.ops.render.render(use_viewport=True, write_still=True)
+		if ob.name in context.scene.collection.objects:
+			context.scene.collection.objects.unlink(ob)
+		load_thumbnail(ob, key, filepath, force=True)
+
+		return {'FINISHED'}
+
+class Render_All_Cycles_Thumbnails(bpy.types.Operator):
+	bl_idname = "view3d.render_all_cycles_thumbnails"
+	bl_label = "Render All Cycles Thumbnails"
+
+	def execute(self, context):
+		ob_count = len(bpy.data.objects)
+		for i, o in enumerate(bpy.data.objects):
+			if o.type != 'MESH': continue
+			key, filepath, is_cached = get_cached_thumbnail(o, context.scene)
+			if is_cached:
+				load_thumbnail(o, key, filepath)
+				continue
+			now = datetime.now()
+			print(f"{now.hour}:{now.minute}:{now.second} {o.name} {i}/{ob_count}")
+			context.scene.collection.objects.link(o)
+			o.hide_viewport = False
+			o.select_set(True)
+			context.view_layer.objects.active = o
+			bpy.ops.view3d.view_selected()
+			context.scene.render.filepath = filepath
+			bpy.ops.render.render(use_viewport=True, write_still=True)
+			o.hide_viewport = True
+			context.scene.collection.objects.unlink(o)
+			load_thumbnail(o, key, filepath)
+		return {'FINISHED'}
+
+registry = [
+	RenderCyclesThumbnail
+	,Render_All_Cycles_Thumbnails
+	,VIEW3D_OT_render_thumbnails_farm
+]
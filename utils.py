@@ -1,22 +1,37 @@
-import bpy, os, shutil
-from datetime import datetime
+import bpy, os
 
-def is_psk(filename):
-	return filename.endswith(".psk") or filename.endswith(".pskx")
+from .extract_files import is_psk
+
+# Environment variable that overrides the extract folder of the addon prefs, eg. on build machines without saved prefs.
+# Background workers inherit it from the process that started them.
+EXTRACT_PATH_ENV = "KENA_EXTRACT_PATH"
+PLACEHOLDER_EXTRACT_PATH = 'D:\\Path_to_your_extract_folder\\'
+
+def set_extract_path(extract_path: str):
+	"""Use this extract folder instead of the one in the addon prefs, in this process and the workers it starts."""
+	os.environ[EXTRACT_PATH_ENV] = os.path.abspath(extract_path)
 
 def get_extract_path(context) -> str:
-	addon_prefs = context.preferences.addons[__package__].preferences
-	extract_path = addon_prefs.extract_path
-	assert extract_path != 'D:\\Path_to_your_extract_folder\\', "Set your extract folder path in the addon prefs!"
+	extract_path = os.environ.get(EXTRACT_PATH_ENV)
+	if not extract_path:
+		addon = context.preferences.addons.get(__package__)
+		extract_path = addon.preferences.extract_path if addon else ""
+	assert extract_path and extract_path != PLACEHOLDER_EXTRACT_PATH, \
+		f"Set your extract folder path in the addon prefs, or in the {EXTRACT_PATH_ENV} environment variable!"
 	return extract_path
 
-def delete_anim_uasset_files():
+def delete_anim_uasset_files(uasset_path: str):
+    """umodel_kena.exe crashes when exporting animations, so delete them from the extracted .uasset files first."""
+    import shutil
     bad_folders = []
     bad_files = []
 
-    for subdir, dirs, files in os.walk("D:/3D/Kena/Extracted/Extracted_uasset/"):
+    for subdir, dirs, files in os.walk(uasset_path):
         if "Animation" in subdir:
-            bad.append(subdir)
+            bad_folders.append(subdir)
+            # Everything in here goes with the folder.
+            dirs.clear()
+            continue
         for f in files:
             if f.startswith("A_") or "Anim" in f:
                 bad_files.append(subdir+os.sep+f)
@@ -32,30 +47,6 @@ def delete_anim_uasset_files():
         os.remove(f)
         print("Deleted file: ", f)
 
-def import_animations(folder: str):
-	counter = 0
-
-	for subdir, dirs, files in os.walk(folder):
-		for file in files:
-			if not file.endswith(".gltf"):
-				continue
-			if file.replace("out.gltf", "") in bpy.data.actions:
-				continue
-			print(file)
-			bpy.ops.import_scene.gltf(filepath=subdir+os.sep+file)
-			counter += 1
-			for o in bpy.context.selected_objects[:]:
-				bpy.data.objects.remove(o)
-
-			action = bpy.data.actions.get('DefAnim_Armature.001') or bpy.data.actions.get('DefAnim_Armature.002') or bpy.data.actions.get('DefAnim_Armature.003') or bpy.data.actions.get('DefAnim_Armature.004')
-			action.name = file.replace("out.gltf", "")
-			action.use_fake_user = True
-			bpy.ops.outliner.orphans_purge(do_recursive=True)
-			if counter > 0:
-				return
-
-# import_animations("D:\\3D\\Kena\\Tools\\ACLAnimViewer_Kena\\Export\\SK_Kenaout")
-
 def set_active_textures():
 	for m in bpy.data.materials:
 		for n in m.node_tree.nodes:
@@ -68,6 +59,9 @@ def set_active_textures():
 					print("No diffuse: ", m.name)
 
 def compress_images():
+	import shutil
+	from .dependency_index import DependencyIndex
+	from .texture_proxies import get_texture_resolution, set_texture_resolution, set_full_res_path
 	# Convert images to .jpg
 	# Except .jpg doesn't have alpha channel, so if an image's Alpha is ever used, don't convert it.
 	C = bpy.context
@@ -76,20 +70,11 @@ def compress_images():
 	C.scene.view_settings.exposure = 0.0
 	C.scene.view_settings.gamma = 1.0
 	C.scene.render.image_settings.file_format = 'JPEG'
+	# Compress the full resolution textures, not their proxies.
+	resolution = get_texture_resolution()
+	set_texture_resolution('FULL')
 
-	images_with_alpha = []
-
-	for o in bpy.data.objects:
-		for ms in o.material_slots:
-			if not ms.material.node_tree:
-				# TODO: Who dis??
-				continue
-			for n in ms.material.node_tree.nodes:
-				if n.type != 'TEX_IMAGE' or not n.image:
-					continue
-				if len(n.outputs[1].links) > 0:
-					images_with_alpha.append(n.image.name)
-
+	images_with_alpha = DependencyIndex.build().images_with_alpha
 
 	for i in bpy.data.images:
 		if i.name == 'Transparent':
@@ -105,7 +90,7 @@ def compress_images():
 			if i.name in images_with_alpha:
 				print("THIS SHOULD BE TGA", i.filepath)
 			else:
-				i.filepath = jpg_rel_path
+				set_full_res_path(i, jpg_rel_path)
 				print("Already compressed, skipped: ", i.filepath)
 
 		if i.name in images_with_alpha:
@@ -114,32 +99,28 @@ def compress_images():
 			# Just copy the file without compressing it.
 			os.makedirs(os.path.dirname(new_abs_path), exist_ok=True)
 			shutil.copy(abs_path, new_abs_path)
-			i.filepath = new_rel_path
+			set_full_res_path(i, new_rel_path)
 			print("Copied", new_abs_path)
 		else:
 			# Save as .jpg in the new location.
 			i.save_render(filepath=jpg_abs_path)
-			i.filepath = jpg_rel_path
+			set_full_res_path(i, jpg_rel_path)
 			print("Compressed", jpg_abs_path)
 
+	# Proxies of the compressed files may not exist yet, those images stay at full resolution until they are built.
+	set_texture_resolution(resolution)
+
 def find_image_users(image_name):
-	for o in bpy.data.objects:
-		for ms in o.material_slots:
-			m = ms.material
-			if not m: continue
-			if not m.node_tree or not m.node_tree.nodes: continue
-			for n in m.node_tree.nodes:
-				if not n.type == 'TEX_IMAGE' or not n.image:
-					continue
-				if n.image.name == image_name:
-					print(o.name)
+	from .dependency_index import DependencyIndex
+	index = DependencyIndex.build()
+	for ob_name in sorted(index.image_users(image_name)):
+		print(ob_name)
 	
 # find_image_users("")
 
 def hookup_alphas():
 	# doesn't work, over-eager, no way to make sure image actually has alpha.
-	import bpy
-
+	# Reading the depth loads the image, so it's checked last.
 	for m in bpy.data.materials:
 		if not m.node_tree or not m.node_tree.nodes:
 			continue
@@ -156,65 +137,16 @@ def hookup_alphas():
 					print(m.name, n.image.name)
 
 def copy_used_images(search_path, replace_path):
+	import shutil
+	from .texture_proxies import get_texture_resolution, set_texture_resolution, set_full_res_path
+	# Copy the full resolution files, not their proxies.
+	resolution = get_texture_resolution()
+	set_texture_resolution('FULL')
 	for i in bpy.data.images:
 		abspath = bpy.path.abspath(i.filepath)
-		i.filepath = i.filepath.replace(search_path, replace_path)
+		set_full_res_path(i, i.filepath.replace(search_path, replace_path))
 		new_abspath = bpy.path.abspath(i.filepath)
 		os.makedirs(os.path.dirname(new_abspath), exist_ok=True)
 		shutil.copyfile(abspath, new_abspath)
 		print(new_abspath)
-
-class RenderCyclesThumbnail(bpy.types.Operator):
-	bl_idname = 'view3d.render_cycles_thumbnail'
-	bl_label = "Render Cycles Thumbnail"
-
-	@classmethod
-	def poll(cls, context):
-		ob = context.object
-		return ob and ob.type == 'MESH' and context.area.ui_type == 'VIEW_3D'
-
-	def execute(self, context):
-		ob = context.object
-		
-		filepath = "//..\\Thumbnails\\" + ob.name + ".png"
-		abspath = bpy.path.abspath(filepath)
-
-		if os.path.isfile(abspath):
-			print("Overwriting: ", abspath)
-			# TODO: Overwrite y/n?
-
-		context.scene.render.filepath = filepath
-		bpy.ops.render.render(use_viewport=True, write_still=True)
-		context.scene.collection.objects.unlink(ob)
-		bpy.ops.ed.lib_id_load_custom_preview({"id": ob}, filepath=abspath)
-
-		return {'FINISHED'}
-
-class Render_All_Cycles_Thumbnails(bpy.types.Operator):
-	bl_idname = "view3d.render_all_cycles_thumbnails"
-	bl_label = "Render All Cycles Thumbnails"
-
-	def execute(self, context):
-		ob_count = len(bpy.data.objects)
-		for i, o in enumerate(bpy.data.objects):
-			if o.type != 'MESH': continue
-			filepath = "//..\\Thumbnails\\" + o.name + ".png"
-			abspath = bpy.path.abspath(filepath)
-			if os.path.isfile(abspath):
-				continue
-			now = datetime.now()
-			print(f"{now.hour}:{now.minute}:{now.second} {o.name} {i}/{ob_count}")
-			context.scene.collection.objects.link(o)
-			o.hide_viewport = False
-			o.select_set(True)
-			context.view_layer.objects.active = o
-			bpy.ops.view3d.view_selected()
-			context.scene.render.filepath = filepath
-			bpy.ops.render.render(use_viewport=True, write_still=True)
-			o.hide_viewport = True
-			context.scene.collection.objects.unlink(o)
-			bpy.ops.ed.lib_id_load_custom_preview({"id": o}, filepath=abspath)
-		return {'FINISHED'}
-
-bpy.utils.register_class(Render_All_Cycles_Thumbnails)
-bpy.utils.register_class(RenderCyclesThumbnail)
\ No newline at end of file
+	set_texture_resolution(resolution)